@@ -0,0 +1,166 @@
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import multiprocessing
+import os
+import shutil
+import tarfile
+from threading import Lock
+import zipfile
+
+# suffixes of archives, compound ones first
+ARCHIVE_SUFFIXES = (('.tar.gz', 'tar'), ('.tgz', 'tar'), ('.tar', 'tar'), ('.zip', 'zip'), ('.gz', 'gz'))
+# members are written to disk by chunks, an archive is never loaded into memory
+EXTRACT_CHUNK = 1024 * 1024
+
+
+class ArchiveTooLarge(Exception):
+    pass
+
+
+def archive_format(file_name: str):
+    """ Format and name without the suffix for the archive file
+
+    :param file_name: name of the file
+    :return: (format, name) or (None, file_name) for other files
+    """
+    lower_name = file_name.lower()
+    for suffix, archive_type in ARCHIVE_SUFFIXES:
+        if lower_name.endswith(suffix) and len(file_name) > len(suffix):
+            return archive_type, file_name[:-len(suffix)]
+    return None, file_name
+
+
+def _target_path(folder: str, member_name: str):
+    """ Path of the member inside the folder, None for absolute paths and paths going out of the folder
+
+    :param folder: folder of the archive
+    :param member_name: name of the member in the archive
+    :return: path or None
+    """
+    target = os.path.realpath(os.path.join(folder, member_name))
+    if os.path.commonpath((folder, target)) != folder or target == folder:
+        return None
+    return target
+
+
+def _write_member(src, target: str, written: int, size_limit) -> int:
+    """ Copy one member to disk by chunks
+
+    :param src: file object of the member
+    :param target: destination path
+    :param written: bytes written from this archive before the member
+    :param size_limit: max bytes for the archive or None
+    :return: bytes written from this archive after the member
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as out:
+        while True:
+            chunk = src.read(EXTRACT_CHUNK)
+            if not chunk:
+                break
+            written += len(chunk)
+            if size_limit is not None and written > size_limit:
+                raise ArchiveTooLarge(f'more than {size_limit} bytes')
+            out.write(chunk)
+    return written
+
+
+def extract_archive(path: str, size_limit=None) -> dict:
+    """ Unpack the archive into the subfolder named after the archive, next to the archive.
+    Runs in a worker process: the result is a plain dict, errors are returned, not raised.
+    Links, devices and members outside the subfolder are skipped.
+
+    :param path: path of the archive
+    :param size_limit: max unpacked bytes, the subfolder is removed when the archive is bigger
+    :return: dict with path, members, bytes and error
+    """
+    archive_type, name = archive_format(os.path.basename(path))
+    folder = os.path.realpath(os.path.join(os.path.dirname(path), name))
+    result = {'path': path, 'members': 0, 'bytes': 0, 'error': None}
+    created = not os.path.exists(folder)
+    written = 0
+    try:
+        if archive_type == 'zip':
+            with zipfile.ZipFile(path) as archive:
+                infos = archive.infolist()
+                if size_limit is not None and sum(info.file_size for info in infos) > size_limit:
+                    raise ArchiveTooLarge(f'more than {size_limit} bytes')
+                for info in infos:
+                    target = _target_path(folder, info.filename)
+                    if target is None:
+                        continue
+                    if info.is_dir():
+                        os.makedirs(target, exist_ok=True)
+                        continue
+                    with archive.open(info) as src:
+                        written = _write_member(src, target, written, size_limit)
+                    result['members'] += 1
+        elif archive_type == 'tar':
+            # stream mode reads the archive once from the start, also for tar.gz
+            with tarfile.open(path, 'r|*') as archive:
+                for member in archive:
+                    target = _target_path(folder, member.name)
+                    if target is None:
+                        continue
+                    if member.isdir():
+                        os.makedirs(target, exist_ok=True)
+                        continue
+                    if not member.isfile():
+                        continue
+                    src = archive.extractfile(member)
+                    written = _write_member(src, target, written, size_limit)
+                    result['members'] += 1
+        elif archive_type == 'gz':
+            os.makedirs(folder, exist_ok=True)
+            with gzip.open(path, 'rb') as src:
+                written = _write_member(src, os.path.join(folder, name), written, size_limit)
+            result['members'] = 1
+        else:
+            result['error'] = 'unknown archive format'
+    except (OSError, EOFError, ArchiveTooLarge, zipfile.BadZipFile, tarfile.TarError) as err:
+        result['error'] = f'{type(err).__name__}: {err}'
+        if created:
+            shutil.rmtree(folder, ignore_errors=True)
+    result['bytes'] = written
+    return result
+
+
+class ArchiveExtractor:
+    """ Unpacks archives in a pool of processes while the moving threads go on with other files
+    """
+
+    def __init__(self, workers=None, size_limit=None):
+        self.workers = workers or os.cpu_count() or 1
+        # processes are started, not forked: the parent is full of running threads
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        self.size_limit = size_limit
+        self.lock = Lock()
+        self.extracted = 0
+        self.failed = 0
+        self.extracted_bytes = 0
+
+    def submit(self, path: str):
+        future = self.executor.submit(extract_archive, path, self.size_limit)
+        future.add_done_callback(self.done)
+
+    def done(self, future):
+        try:
+            result = future.result()
+        except Exception as err:
+            result = {'path': None, 'bytes': 0, 'error': f'{type(err).__name__}: {err}'}
+        with self.lock:
+            self.extracted_bytes += result['bytes']
+            if result['error'] is None:
+                self.extracted += 1
+            else:
+                self.failed += 1
+        if result['error'] is not None:
+            print(f'Skip archive {result["path"]}: {result["error"]}')
+
+    def close(self):
+        """ Wait for all archives
+
+        :return: None
+        """
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,379 @@
+import argparse
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+from time import perf_counter
+import zipfile
+
+from archives import ArchiveExtractor, archive_format
+from sort_folder_treads import FILES_DICT, UNKNOWN_FOLDER, get_folder_name
+
+SYNTHETIC_EXT = [ext for values in FILES_DICT.values() for ext in values] + ['py', 'exe', 'iso', 'bin', 'xyz']
+
+
+def synthetic_names(count: int, seed: int = 0) -> list:
+    """ Reproducible file names with known, unknown and upper case extensions
+
+    :param count: number of names
+    :param seed: random seed
+    :return: list of names
+    """
+    rnd = random.Random(seed)
+    names = []
+    for i in range(count):
+        ext = rnd.choice(SYNTHETIC_EXT)
+        names.append(f'file_{i}.{ext if rnd.random() < 0.5 else ext.lower()}')
+    return names
+
+
+def legacy_folder_name(file_name: str, files_dict: dict) -> str:
+    """ Classification as file_handler did it before the lookup table:
+    linear search in every list of the dictionary, the last match wins
+
+    :param file_name: name of the file
+    :param files_dict: FILES_DICT with lower case values
+    :return: folder name
+    """
+    file_ext = file_name.split('.')[-1].lower()
+    folder_name = UNKNOWN_FOLDER
+    for key, value in files_dict.items():
+        if file_ext in value:
+            folder_name = key
+    return folder_name
+
+
+def bench_classify(count: int, repeat: int):
+    """ Classify synthetic names with the old linear search and with the lookup table
+
+    :param count: number of names
+    :param repeat: number of runs, the best one is printed
+    :return: None
+    """
+    names = synthetic_names(count)
+    lower_dict = {key: [value.lower() for value in values] for key, values in FILES_DICT.items()}
+    results = {}
+    for title, func in (('legacy', lambda name: legacy_folder_name(name, lower_dict)),
+                        ('lookup table', get_folder_name)):
+        best = None
+        for _ in range(repeat):
+            start = perf_counter()
+            for name in names:
+                func(name)
+            elapsed = perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[title] = best
+        print(f'{title}: {best:.3f} s, {count / best:,.0f} names/s')
+    print(f'speedup: {results["legacy"] / results["lookup table"]:.2f}x')
+
+
+def make_archives(folder: str, count: int, members: int, member_size: int, seed: int = 0) -> list:
+    """ Reproducible zip and tar.gz archives with compressible members
+
+    :param folder: where to create archives
+    :param count: number of archives
+    :param members: files in each archive
+    :param member_size: bytes in each file
+    :param seed: random seed
+    :return: list of paths
+    """
+    rnd = random.Random(seed)
+    words = [''.join(rnd.choice('abcdefghij') for _ in range(rnd.randint(2, 9))) for _ in range(500)]
+    paths = []
+    for i in range(count):
+        contents = []
+        for _ in range(members):
+            text = ' '.join(rnd.choice(words) for _ in range(member_size // 5))
+            contents.append(text.encode()[:member_size])
+        if i % 2:
+            path = os.path.join(folder, f'archive_{i}.zip')
+            with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for j, data in enumerate(contents):
+                    archive.writestr(f'dir/file_{j}.txt', data)
+        else:
+            path = os.path.join(folder, f'archive_{i}.tar.gz')
+            with tarfile.open(path, 'w:gz') as archive:
+                for j, data in enumerate(contents):
+                    info = tarfile.TarInfo(f'dir/file_{j}.txt')
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+        paths.append(path)
+    return paths
+
+
+def bench_extract(count: int, members: int, member_size: int, workers=None):
+    """ Unpack the same archives with serial shutil.unpack_archive and with ArchiveExtractor
+
+    :param count: number of archives
+    :param members: files in each archive
+    :param member_size: bytes in each file
+    :param workers: processes for ArchiveExtractor
+    :return: None
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_archives(folder, count, members, member_size)
+
+        def clean():
+            for path in paths:
+                shutil.rmtree(os.path.join(folder, archive_format(os.path.basename(path))[1]), ignore_errors=True)
+
+        start = perf_counter()
+        for path in paths:
+            shutil.unpack_archive(path, os.path.join(folder, archive_format(os.path.basename(path))[1]))
+        serial = perf_counter() - start
+        clean()
+
+        start = perf_counter()
+        extractor = ArchiveExtractor(workers)
+        for path in paths:
+            extractor.submit(path)
+        extractor.close()
+        parallel = perf_counter() - start
+        print(f'serial shutil.unpack_archive: {serial:.3f} s, {count / serial:,.0f} archives/s')
+        print(f'ArchiveExtractor ({extractor.workers} processes): {parallel:.3f} s, '
+              f'{count / parallel:,.0f} archives/s, failed {extractor.failed}')
+        print(f'speedup: {serial / parallel:.2f}x')
+
+
+def parse_mix(text: str) -> dict:
+    """ 'jpg:3,txt:2,xyz:1' -> {'jpg': 3.0, 'txt': 2.0, 'xyz': 1.0}
+
+    :param text: extensions with weights
+    :return: dict
+    """
+    mix = {}
+    for item in text.split(','):
+        ext, _, weight = item.partition(':')
+        mix[ext.strip()] = float(weight or 1)
+    return mix
+
+
+def file_size(rnd: random.Random, size_dist: str) -> int:
+    """ Size of a synthetic file: 'fixed:N', 'uniform:A:B' or 'lognormal:MU:SIGMA'
+
+    :param rnd: random generator
+    :param size_dist: distribution
+    :return: size in bytes
+    """
+    kind, *values = size_dist.split(':')
+    values = [float(value) for value in values]
+    if kind == 'fixed':
+        return int(values[0])
+    if kind == 'uniform':
+        return rnd.randint(int(values[0]), int(values[1]))
+    if kind == 'lognormal':
+        return int(rnd.lognormvariate(values[0], values[1]))
+    raise ValueError(f'unknown size distribution {size_dist}')
+
+
+def make_tree(folder: str, depth: int, fanout: int, files: int, size_dist: str, ext_mix: dict,
+              seed: int = 0) -> int:
+    """ Reproducible tree: every folder has fanout subfolders down to depth,
+    files are spread over all folders with random sizes and extensions
+
+    :param folder: root of the tree
+    :param depth: levels of subfolders
+    :param fanout: subfolders in each folder
+    :param files: number of files
+    :param size_dist: distribution of sizes, see file_size
+    :param ext_mix: extensions with weights
+    :param seed: random seed
+    :return: total bytes
+    """
+    rnd = random.Random(seed)
+    folders = [folder]
+    level = [folder]
+    for _ in range(depth):
+        level = [os.path.join(parent, f'dir_{i}') for parent in level for i in range(fanout)]
+        folders.extend(level)
+    for path in folders:
+        os.makedirs(path, exist_ok=True)
+    extensions, weights = list(ext_mix), list(ext_mix.values())
+    total = 0
+    buffer = b''
+    for i in range(files):
+        size = file_size(rnd, size_dist)
+        if size > len(buffer):
+            buffer = b'x' * max(size, 2 * len(buffer))
+        path = os.path.join(rnd.choice(folders), f'file_{i}.{rnd.choices(extensions, weights)[0]}')
+        with open(path, 'wb') as file:
+            file.write(buffer[:size])
+        total += size
+    return total
+
+
+def run_serial(folder: str):
+    import no_threads
+    no_threads.main(folder)
+
+
+def run_threads(folder: str):
+    import sort_folder_treads
+    # synthetic archives are not real archives, only the sorting is measured
+    sort_folder_treads.main(folder, extract=False)
+
+
+def run_async(folder: str):
+    import sort_folder_treads
+    sort_folder_treads.main(folder, extract=False, backend='async')
+
+
+STRATEGIES = {'serial': run_serial,
+              'threads': run_threads,
+              'async': run_async,
+              }
+
+
+def os_threads() -> int:
+    """ Threads of this process: from /proc on Linux, python threads elsewhere
+
+    :return: number of threads
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return threading.active_count()
+
+
+def run_one(strategy: str, folder: str) -> dict:
+    """ Sort the folder with the strategy in this process and measure it
+
+    :param strategy: name from STRATEGIES
+    :param folder: folder to sort
+    :return: wall time, peak RSS and peak thread count
+    """
+    peak_threads = 0
+    stop = threading.Event()
+
+    def sample():
+        nonlocal peak_threads
+        while not stop.wait(0.005):
+            # the sampling thread itself is not counted
+            peak_threads = max(peak_threads, os_threads() - 1)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = perf_counter()
+    with redirect_stdout(io.StringIO()):
+        STRATEGIES[strategy](folder)
+    wall = perf_counter() - start
+    stop.set()
+    sampler.join()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    peak_rss = max_rss if sys.platform == 'darwin' else max_rss * 1024
+    return {'wall': wall, 'peak_rss': peak_rss, 'peak_threads': max(peak_threads, 1)}
+
+
+def bench_sort(args) -> dict:
+    """ Run every strategy several times on the same generated tree, each run in a new process
+
+    :param args: command line arguments
+    :return: results
+    """
+    ext_mix = parse_mix(args.ext_mix)
+    results = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'depth': args.depth, 'fanout': args.fanout, 'files': args.files,
+                        'size_dist': args.size_dist, 'ext_mix': ext_mix, 'repeat': args.repeat,
+                        'seed': args.seed},
+               'strategies': {}}
+    try:
+        results['meta']['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                                   text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                                   check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        results['meta']['commit'] = None
+    for strategy in args.strategies:
+        runs = []
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as folder:
+                make_tree(folder, args.depth, args.fanout, args.files, args.size_dist, ext_mix, args.seed)
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), 'run-one', strategy, folder],
+                                        capture_output=True, text=True, check=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+        walls = [run['wall'] for run in runs]
+        median = statistics.median(walls)
+        results['strategies'][strategy] = {'runs': runs,
+                                           'wall_min': min(walls),
+                                           'wall_median': median,
+                                           'files_per_sec': args.files / median if median else 0.0,
+                                           'peak_rss': max(run['peak_rss'] for run in runs),
+                                           'peak_threads': max(run['peak_threads'] for run in runs)}
+    return results
+
+
+def markdown_table(results: dict) -> str:
+    """ Results of bench_sort as a markdown table
+
+    :param results: results
+    :return: table
+    """
+    lines = ['| strategy | wall min, s | wall median, s | files/s | peak RSS, MiB | threads |',
+             '|---|---:|---:|---:|---:|---:|']
+    for strategy, result in results['strategies'].items():
+        lines.append(f'| {strategy} | {result["wall_min"]:.3f} | {result["wall_median"]:.3f} '
+                     f'| {result["files_per_sec"]:,.0f} | {result["peak_rss"] / 2 ** 20:.1f} '
+                     f'| {result["peak_threads"]} |')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the folder sorter')
+    commands = parser.add_subparsers(dest='command', required=True)
+    classify = commands.add_parser('classify', help='extension lookup micro-benchmark')
+    classify.add_argument('--count', type=int, default=1_000_000)
+    classify.add_argument('--repeat', type=int, default=3)
+    extract = commands.add_parser('extract', help='serial and parallel unpacking of archives')
+    extract.add_argument('--count', type=int, default=2000)
+    extract.add_argument('--members', type=int, default=4)
+    extract.add_argument('--member-size', type=int, default=256 * 1024)
+    extract.add_argument('--workers', type=int, default=None)
+    sort = commands.add_parser('sort', help='sorting strategies on a generated tree')
+    sort.add_argument('--strategies', nargs='+', choices=list(STRATEGIES), default=list(STRATEGIES))
+    sort.add_argument('--repeat', type=int, default=3)
+    sort.add_argument('--depth', type=int, default=3)
+    sort.add_argument('--fanout', type=int, default=4)
+    sort.add_argument('--files', type=int, default=20000)
+    sort.add_argument('--size-dist', default='lognormal:8:1.5',
+                      help="'fixed:N', 'uniform:A:B' or 'lognormal:MU:SIGMA'")
+    sort.add_argument('--ext-mix', default='jpg:3,png:2,txt:3,pdf:1,mp3:1,mp4:1,zip:1,xyz:1',
+                      help='extensions with weights')
+    sort.add_argument('--seed', type=int, default=0)
+    sort.add_argument('--json', default=None, help='write the results to this file')
+    sort.add_argument('--markdown', default=None, help='write the table to this file')
+    one = commands.add_parser('run-one', help='one measured run, used by the sort benchmark')
+    one.add_argument('strategy', choices=list(STRATEGIES))
+    one.add_argument('folder')
+    args = parser.parse_args()
+
+    if args.command == 'classify':
+        bench_classify(args.count, args.repeat)
+    elif args.command == 'extract':
+        bench_extract(args.count, args.members, args.member_size, args.workers)
+    elif args.command == 'sort':
+        sort_results = bench_sort(args)
+        table = markdown_table(sort_results)
+        print(table)
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump(sort_results, file, indent=4)
+        if args.markdown:
+            with open(args.markdown, 'w') as file:
+                file.write(table + '\n')
+    elif args.command == 'run-one':
+        print(json.dumps(run_one(args.strategy, args.folder)))
@@ -0,0 +1,114 @@
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import mmap
+import os
+
+# bytes hashed from the start and from the end of a file before the full hash
+PARTIAL_BLOCK = 64 * 1024
+HASH_WORKERS = 8
+
+
+def _files(folders):
+    """ All files in the folders and their subfolders with their stat
+
+    :param folders: list of folders
+    :return: generator of (path, stat)
+    """
+    stack = [folder for folder in folders if os.path.isdir(folder)]
+    while stack:
+        with os.scandir(stack.pop()) as elements:
+            for element in elements:
+                if element.is_dir(follow_symlinks=False):
+                    stack.append(element.path)
+                elif element.is_file(follow_symlinks=False):
+                    yield element.path, element.stat(follow_symlinks=False)
+
+
+def _hash(path: str, size: int, partial: bool):
+    """ Hash of the file read through mmap: first and last PARTIAL_BLOCK or the whole file
+
+    :param path: path of the file
+    :param size: size of the file
+    :param partial: hash only the start and the end
+    :return: digest or None if the file can not be read
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    try:
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if partial and size > 2 * PARTIAL_BLOCK:
+                digest.update(data[:PARTIAL_BLOCK])
+                digest.update(data[-PARTIAL_BLOCK:])
+            else:
+                digest.update(data)
+    except (OSError, ValueError):
+        return None
+    return digest.digest()
+
+
+def _split(executor, groups: list, partial: bool) -> list:
+    """ Split groups of paths by the hash of the files, groups of one file are dropped
+
+    :param executor: thread pool
+    :param groups: list of (size, paths)
+    :param partial: use the partial hash
+    :return: list of (size, paths)
+    """
+    jobs = [(index, size, path) for index, (size, paths) in enumerate(groups) for path in paths]
+    digests = executor.map(lambda job: _hash(job[2], job[1], partial), jobs)
+    split = defaultdict(list)
+    for (index, size, path), digest in zip(jobs, digests):
+        if digest is not None:
+            split[(index, size, digest)].append(path)
+    return [(size, paths) for (_, size, _), paths in split.items() if len(paths) > 1]
+
+
+def find_duplicates(folders, workers: int = HASH_WORKERS) -> list:
+    """ Groups of files with the same content: same size first, then the same partial hash,
+    the full hash only for files bigger than the partial blocks that are still together.
+    Files linked to the same inode are counted once, empty files are skipped.
+
+    :param folders: list of folders
+    :param workers: threads hashing files
+    :return: list of (size, sorted paths), the first path is kept as the original
+    """
+    # the sizes are counted first, so only the paths of files sharing a size are kept in memory
+    sizes = Counter((stat_result.st_dev, stat_result.st_size)
+                    for _, stat_result in _files(folders) if stat_result.st_size)
+    same_size = defaultdict(dict)
+    for path, stat_result in _files(folders):
+        key = (stat_result.st_dev, stat_result.st_size)
+        if sizes.get(key, 0) > 1:
+            same_size[key].setdefault(stat_result.st_ino, path)
+    groups = [(size, list(paths.values())) for (_, size), paths in same_size.items() if len(paths) > 1]
+    del sizes, same_size
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        groups = _split(executor, groups, partial=True)
+        # the partial hash of a small file is already the hash of the whole file
+        small = [group for group in groups if group[0] <= 2 * PARTIAL_BLOCK]
+        large = [group for group in groups if group[0] > 2 * PARTIAL_BLOCK]
+        groups = small + _split(executor, large, partial=False)
+    return [(size, sorted(paths)) for size, paths in groups]
+
+
+def link_duplicates(groups: list) -> int:
+    """ Replace every copy with a hardlink to the first file of its group
+
+    :param groups: result of find_duplicates
+    :return: bytes saved
+    """
+    saved = 0
+    for size, paths in groups:
+        original = paths[0]
+        for path in paths[1:]:
+            temp_path = f'{path}.dedup'
+            try:
+                os.link(original, temp_path)
+                os.replace(temp_path, path)
+            except OSError as err:
+                print(f'Skip duplicate {path}: {err}')
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                continue
+            saved += size
+    return saved
@@ -0,0 +1,93 @@
+from collections import defaultdict
+import os
+from pathlib import Path
+import sqlite3
+from time import time_ns
+
+MANIFEST_SUFFIX = '.sort_manifest.sqlite'
+# a folder changed this close to the save may change again with the same mtime (coarse timestamps)
+RACY_WINDOW_NS = 1_000_000_000
+# state of a folder that has to be listed on the next run, never equal to a stat
+DIRTY = (None, None, None)
+
+
+def manifest_path(base_folder) -> Path:
+    """ The manifest is kept next to the sorted folder, not inside it, so it is never sorted itself
+
+    :param base_folder: folder to sort
+    :return: path of the manifest file
+    """
+    folder = Path(base_folder).resolve()
+    return folder.with_name(f'.{folder.name}{MANIFEST_SUFFIX}')
+
+
+class ScanManifest:
+    """ State (mtime, size, inode) of every folder after the last run, stored in SQLite.
+    A folder with the same state was not changed since then: its listing is not read again,
+    only its known subfolders are checked. A folder left dirty by the last run has no state and is always listed.
+    """
+
+    def __init__(self, base_folder):
+        self.path = manifest_path(base_folder)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS folders ('
+                          'path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER, size INTEGER, inode INTEGER)')
+        self.folders = {}
+        self.subfolders = defaultdict(list)
+        for path, parent, mtime_ns, size, inode in self.conn.execute('SELECT * FROM folders'):
+            self.folders[path] = (mtime_ns, size, inode)
+            self.subfolders[parent].append(path)
+
+    @staticmethod
+    def state(stat_result) -> tuple:
+        return stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino
+
+    def unchanged(self, folder: str, stat_result) -> bool:
+        return self.folders.get(folder) == self.state(stat_result)
+
+    def children(self, folder: str) -> list:
+        return self.subfolders.get(folder, [])
+
+    def save(self, folders: dict, left_to_sort, failed=()):
+        """ Write the state of the listed folders after the run. A folder that changed since its listing,
+        by the moves or by new files, is stored as it is now only if a new listing finds nothing left to sort,
+        otherwise it is marked dirty and listed again on the next run. The stat is taken before that listing,
+        a file added later changes the mtime. A folder with a failed listing or move is always marked dirty,
+        its mtime may not have changed.
+
+        :param folders: every folder of the run -> its stat when the listing was read, None if it was not read
+        :param left_to_sort: callable, folder -> True if it has files or subfolders the run did not take
+        :param failed: folders with a listing or a move that failed in the run
+        :return: None
+        """
+        rows = []
+        removed = [path for path in self.folders if path not in folders]
+        now = time_ns()
+        for folder, listed_stat in folders.items():
+            if listed_stat is None and folder not in failed:
+                continue
+            try:
+                stat_result = os.stat(folder, follow_symlinks=False)
+            except FileNotFoundError:
+                # removed as an empty folder
+                removed.append(folder)
+                continue
+            if folder in failed:
+                rows.append((folder, os.path.dirname(folder), *DIRTY))
+                continue
+            state = self.state(stat_result)
+            racy = now - stat_result.st_mtime_ns < RACY_WINDOW_NS
+            if racy or state != self.state(listed_stat):
+                try:
+                    dirty = left_to_sort(folder)
+                except OSError:
+                    dirty = True
+                if dirty or racy:
+                    state = DIRTY
+            rows.append((folder, os.path.dirname(folder), *state))
+        with self.conn:
+            self.conn.executemany('DELETE FROM folders WHERE path = ?', ((path,) for path in removed))
+            self.conn.executemany('INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?, ?)', rows)
+
+    def close(self):
+        self.conn.close()
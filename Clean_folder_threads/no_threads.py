@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 import shutil
+import sys
 from time import monotonic
 
 # create a dictionary of folders and extensions
@@ -23,7 +24,7 @@ def ext_dict_normalize(files_dict):
             values[i] = values[i].lower()
 
 
-def file_handler(path: Path):
+def file_handler(path: Path, base_folder):
     """ Processing each file based on the dictionary: renaming - by the normalize function
          create folder by dictionary key if missing
          moving the file to this folder, adding it to the list of known extensions depending on the dictionary key
@@ -32,6 +33,7 @@ def file_handler(path: Path):
          for unknown - create a list of unknown extensions
 
     :param path: path
+    :param base_folder: folder to sort
     :return: make manipulation with files
     """
 
@@ -50,23 +52,24 @@ def file_handler(path: Path):
     shutil.move(str(path), new_file_path)
 
 
-def get_dir_elements(path: Path):
+def get_dir_elements(path: Path, base_folder):
     """ we get access to all elements of the directory, taking into account attachments
 
     :param path: path
+    :param base_folder: folder to sort
     :return: None
     """
 
     for element in path.iterdir():
         # if is file:
         if element.is_file():
-            file_handler(element)  # do file processing
+            file_handler(element, base_folder)  # do file processing
         # if folder:
         if element.is_dir():
             if element.name in FILES_DICT or not os.listdir(str(element)):
                 # do not touch empty and folders from the dictionary
                 continue
-            get_dir_elements(element)
+            get_dir_elements(element, base_folder)
 
 
 def remove_empty_folder(path: Path):
@@ -93,7 +96,7 @@ def main(base_folder):
     """
     path = Path(base_folder)
     ext_dict_normalize(FILES_DICT)
-    get_dir_elements(path)
+    get_dir_elements(path, base_folder)
     # print(files_list)
     remove_empty_folder(path)
 
@@ -101,7 +104,7 @@ def main(base_folder):
 
 if __name__ == '__main__':
     # base_folder = input('Enter folder for sort: ')
-    base_folder = 'd:\\Test\\'
+    base_folder = sys.argv[1] if len(sys.argv) > 1 else 'd:\\Test\\'
     # check if the specified folder exists and is folder
     if not (os.path.exists(base_folder) and Path(base_folder).is_dir()):
         print('Path incorrect')
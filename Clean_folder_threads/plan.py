@@ -0,0 +1,151 @@
+from array import array
+import json
+import os
+
+PLAN_VERSION = 1
+# buckets for the collision check, only one bucket is expanded into python objects at a time
+COLLISION_BUCKETS = 256
+
+
+class MovePlan:
+    """ Moves of one sorting run kept in columns instead of a list of path pairs:
+    every source folder is stored once, names are one utf-8 blob with offsets,
+    the destination is a category index. 13 bytes per file plus the names, 12 more while it is built.
+    """
+
+    def __init__(self, base_folder: str, categories: list):
+        self.base_folder = base_folder
+        self.categories = list(categories)
+        self.category_index = {category: i for i, category in enumerate(self.categories)}
+        self.folders = []
+        self.folder_index = {}
+        self.file_folders = array('I')
+        self.file_categories = array('B')
+        self.names = bytearray()
+        self.offsets = array('Q', [0])
+        # (hash of destination, file index) by bucket, filled while files are added
+        self.hashes = [array('q') for _ in range(COLLISION_BUCKETS)]
+        self.indexes = [array('I') for _ in range(COLLISION_BUCKETS)]
+        self.collisions = array('Q')
+
+    def __len__(self):
+        return len(self.file_folders)
+
+    def add_folder(self, folder: str) -> int:
+        index = self.folder_index.get(folder)
+        if index is None:
+            index = self.folder_index[folder] = len(self.folders)
+            self.folders.append(folder)
+        return index
+
+    def add(self, path: str, category: str):
+        """ Add the move of the file into the category folder
+
+        :param path: path of the file
+        :param category: destination folder name
+        :return: None
+        """
+        folder, name = os.path.split(path)
+        index = len(self.file_folders)
+        self.file_folders.append(self.add_folder(folder))
+        self.file_categories.append(self.category_index[category])
+        self.names += name.encode('utf-8', 'surrogateescape')
+        self.offsets.append(len(self.names))
+        key = hash((category, name))
+        self.hashes[key % COLLISION_BUCKETS].append(key)
+        self.indexes[key % COLLISION_BUCKETS].append(index)
+
+    def name(self, index: int) -> str:
+        return self.names[self.offsets[index]:self.offsets[index + 1]].decode('utf-8', 'surrogateescape')
+
+    def source(self, index: int) -> str:
+        return os.path.join(self.folders[self.file_folders[index]], self.name(index))
+
+    def destination(self, index: int) -> str:
+        return os.path.join(self.base_folder, self.categories[self.file_categories[index]], self.name(index))
+
+    def find_collisions(self):
+        """ Files that would overwrite a file moved before them or a file already in the category folder.
+        The first file of a name is moved, the next ones are collisions and are skipped by the execution.
+
+        :return: None
+        """
+        # only hashes of the files already in the category folders are kept, a match is checked on disk
+        existing = [array('q') for _ in range(COLLISION_BUCKETS)]
+        for category in self.categories:
+            folder = os.path.join(self.base_folder, category)
+            if not os.path.isdir(folder):
+                continue
+            with os.scandir(folder) as elements:
+                for element in elements:
+                    key = hash((category, element.name))
+                    existing[key % COLLISION_BUCKETS].append(key)
+        collisions = []
+        for bucket in range(COLLISION_BUCKETS):
+            same_key = {}
+            for key, index in zip(self.hashes[bucket], self.indexes[bucket]):
+                same_key.setdefault(key, []).append(index)
+            bucket_existing = set(existing[bucket])
+            existing[bucket] = None
+            for key, indexes in same_key.items():
+                if len(indexes) == 1 and key not in bucket_existing:
+                    continue
+                # equal hashes are checked by the real destination
+                seen = set()
+                for index in indexes:
+                    destination = self.destination(index)
+                    if destination in seen or (key in bucket_existing and os.path.lexists(destination)):
+                        collisions.append(index)
+                    seen.add(destination)
+        self.collisions = array('Q', sorted(collisions))
+        self.hashes = self.indexes = None
+
+    def summary(self) -> dict:
+        """ Number of files by category and collisions
+
+        :return: dict
+        """
+        counts = [0] * len(self.categories)
+        for category in self.file_categories:
+            counts[category] += 1
+        return {'files': len(self),
+                'folders': len(self.folders),
+                'collisions': len(self.collisions),
+                'by_category': {category: counts[i] for i, category in enumerate(self.categories) if counts[i]},
+                'plan_bytes': (len(self.names) + self.offsets.itemsize * len(self.offsets)
+                               + self.file_folders.itemsize * len(self.file_folders) + len(self.file_categories)),
+                }
+
+    def save(self, path: str):
+        """ One json line with the header, then the columns as raw arrays
+
+        :param path: plan file
+        :return: None
+        """
+        columns = (self.file_folders, self.file_categories, self.offsets, self.collisions)
+        header = {'version': PLAN_VERSION, 'base_folder': self.base_folder, 'categories': self.categories,
+                  'folders': self.folders, 'names': len(self.names),
+                  'columns': [[column.typecode, len(column)] for column in columns]}
+        with open(path, 'wb') as file:
+            file.write(json.dumps(header).encode() + b'\n')
+            for column in columns:
+                column.tofile(file)
+            file.write(self.names)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, 'rb') as file:
+            header = json.loads(file.readline())
+            if header['version'] != PLAN_VERSION:
+                raise ValueError(f'unknown plan version {header["version"]}')
+            plan = cls(header['base_folder'], header['categories'])
+            plan.hashes = plan.indexes = None
+            plan.folders = header['folders']
+            columns = []
+            for typecode, length in header['columns']:
+                column = array(typecode)
+                column.fromfile(file, length)
+                columns.append(column)
+            plan.file_folders, plan.file_categories, plan.offsets, plan.collisions = columns
+            plan.names = bytearray(file.read(header['names']))
+        return plan
@@ -1,32 +1,239 @@
+import argparse
+import asyncio
 from concurrent.futures import ThreadPoolExecutor
+import errno
 import os
 from pathlib import Path
 import shutil
+import stat
 from time import monotonic
-from threading import Thread
+from threading import Thread, Lock, Event
+from queue import Queue
+from types import MappingProxyType
+
+from archives import ArchiveExtractor
+from dedup import find_duplicates, link_duplicates
+from manifest import ScanManifest
+from plan import MovePlan
 
 # create a dictionary of folders and extensions
 FILES_DICT = {'images': ['JPEG', 'PNG', 'JPG', 'SVG'],
               'documents': ['DOC', 'DOCX', 'TXT', 'PDF', 'XLSX', 'PPTX'],
               'audio': ['MP3', 'OGG', 'WAV', 'AMR'],
               'video': ['AVI', 'MP4', 'MOV', 'MKV'],
-              'archives': ['ZIP', 'GZ', 'TAR']
+              'archives': ['ZIP', 'GZ', 'TAR', 'TAR.GZ']
               }
+UNKNOWN_FOLDER = 'Unknown'
+# files of this folder are unpacked after the move
+ARCHIVES_FOLDER = 'archives'
+# folders checked for copies of the same file in the dedup mode
+DEDUP_FOLDERS = ('images', 'documents')
+
+# fixed number of threads walking the tree, independent of its size
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+# the number of moving threads starts from MIN_MOVE_WORKERS and is tuned by the measured speed
+MIN_MOVE_WORKERS = 2
+MAX_MOVE_WORKERS = 256
+# seconds between two measurements of the moving speed
+ADJUST_INTERVAL = 0.5
+# relative change of the speed that is not taken as an improvement or a loss
+ADJUST_TOLERANCE = 0.05
+# files found but not moved yet, the scanner waits when the queue is full
+FILES_QUEUE_SIZE = 10000
+# threads doing the blocking calls (scandir, stat, rename) for the event loop of the async backend
+IO_WORKERS = 8
+# files being moved at the same time in the async backend
+MAX_IN_FLIGHT = 4096
+# files moved by one task when a saved plan is executed, and the number of threads for it
+PLAN_BATCH = 1000
+PLAN_WORKERS = 16
+# chunk for the copy between devices, the data does not pass through python
+COPY_CHUNK = 8 * 1024 * 1024
+
+# folders already created by file_handler, makedirs is called once per folder
+created_folders = set()
+created_folders_lock = Lock()
+
+
+class SortStats:
+    """ Counters of one sorting run, shared by the scanning and the moving threads
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.start = monotonic()
+        self.files_found = 0
+        self.files_moved = 0
+        self.peak_queue = 0
+        self.scan_time = None
+        self.first_move = None
+        self.total_time = None
+        self.move_workers = None
+        self.peak_move_workers = 0
+        self.archives_extracted = 0
+        self.archives_failed = 0
+        self.extracted_bytes = 0
+        self.folders_listed = 0
+        self.folders_unchanged = 0
+        self.duplicates = 0
+        self.duplicate_bytes = 0
+        self.folders_removed = 0
+        # folders with a listing or a move that failed, the manifest lists them again on the next run
+        self.failed_folders = set()
 
-files_list = []
+    def folder_scanned(self, listed: bool):
+        with self.lock:
+            if listed:
+                self.folders_listed += 1
+            else:
+                self.folders_unchanged += 1
 
-def ext_dict_normalize(files_dict):
-    """Change all values in dict to lower case
+    def folder_failed(self, folder: str):
+        with self.lock:
+            self.failed_folders.add(folder)
+
+    def file_found(self, queue_depth: int):
+        with self.lock:
+            self.files_found += 1
+            if queue_depth > self.peak_queue:
+                self.peak_queue = queue_depth
+
+    def file_moved(self):
+        with self.lock:
+            self.files_moved += 1
+            if self.first_move is None:
+                self.first_move = monotonic() - self.start
+
+    def summary(self) -> dict:
+        """ Result of the run
+
+        :return: dict
+        """
+        total_time = self.total_time if self.total_time is not None else monotonic() - self.start
+        return {'files_found': self.files_found,
+                'files_moved': self.files_moved,
+                'peak_queue': self.peak_queue,
+                'folders_listed': self.folders_listed,
+                'folders_unchanged': self.folders_unchanged,
+                'scan_time': self.scan_time,
+                'first_move': self.first_move,
+                'total_time': total_time,
+                'files_per_sec': self.files_moved / total_time if total_time else 0.0,
+                'move_workers': self.move_workers,
+                'peak_move_workers': self.peak_move_workers,
+                'archives_extracted': self.archives_extracted,
+                'archives_failed': self.archives_failed,
+                'extracted_bytes': self.extracted_bytes,
+                'duplicates': self.duplicates,
+                'duplicate_bytes': self.duplicate_bytes,
+                'folders_removed': self.folders_removed,
+                }
+
+
+def ext_dict_normalize(files_dict) -> MappingProxyType:
+    """Build the table extension -> folder name with all extensions in lower case
+    if an extension is listed in several folders the first one wins
 
     :param files_dict: dict
-    :return: lower values in dict
+    :return: read-only dict
     """
+    ext_table = {}
     for key, values in files_dict.items():
-        for i in range(len(values)):
-            values[i] = values[i].lower()
+        for value in values:
+            ext_table.setdefault(value.lower(), key)
+    return MappingProxyType(ext_table)
+
 
+EXT_TABLE = ext_dict_normalize(FILES_DICT)
+# last parts of compound extensions (gz for tar.gz), only these names need a second lookup
+COMPOUND_TAILS = frozenset(ext.rsplit('.', 1)[1] for ext in EXT_TABLE if '.' in ext)
+
+
+def get_folder_name(file_name: str, ext_table=EXT_TABLE) -> str:
+    """ Folder name for the file by its extension, compound extensions like tar.gz are checked first
+
+    :param file_name: name of the file
+    :param ext_table: table from ext_dict_normalize
+    :return: folder name
+    """
+    name = file_name.lower()
+    stem, dot, file_ext = name.rpartition('.')
+    if not dot:
+        return UNKNOWN_FOLDER
+    if file_ext in COMPOUND_TAILS and '.' in stem:
+        folder_name = ext_table.get(f'{stem.rpartition(".")[2]}.{file_ext}')
+        if folder_name is not None:
+            return folder_name
+    return ext_table.get(file_ext, UNKNOWN_FOLDER)
+
+
+def ensure_folder(folder: str):
+    """ Create the folder once, next calls for the same folder do not touch the disk
+
+    :param folder: path of the folder
+    :return: None
+    """
+    if folder in created_folders:
+        return
+    with created_folders_lock:
+        if folder not in created_folders:
+            os.makedirs(folder, exist_ok=True)
+            created_folders.add(folder)
+
+
+def copy_file(src: str, dst: str):
+    """ Copy the file by chunks inside the kernel: copy_file_range, sendfile if it is not supported,
+    plain shutil copy where neither exists
+
+    :param src: source path
+    :param dst: destination path
+    :return: None
+    """
+    copy_range = getattr(os, 'copy_file_range', None)
+    sendfile = getattr(os, 'sendfile', None)
+    if copy_range is None and sendfile is None:
+        shutil.copyfile(src, dst)
+    else:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+            while True:
+                try:
+                    if copy_range is not None:
+                        sent = copy_range(in_fd, out_fd, COPY_CHUNK)
+                    else:
+                        sent = sendfile(out_fd, in_fd, None, COPY_CHUNK)
+                except OSError as err:
+                    # old kernels and some file systems do not support copy_file_range between devices
+                    if copy_range is not None and err.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                                                errno.EOPNOTSUPP):
+                        copy_range = None
+                        continue
+                    raise
+                if not sent:
+                    break
+    shutil.copystat(src, dst)
 
-def file_handler(path: Path):
+
+def move_file(src: str, dst: str, same_device: bool = True):
+    """ Move the file: one rename on the same device, copy and delete between devices
+
+    :param src: source path
+    :param dst: destination path
+    :param same_device: source and destination are on the same device
+    :return: None
+    """
+    if same_device:
+        try:
+            os.replace(src, dst)
+            return
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+    copy_file(src, dst)
+    os.unlink(src)
+
+
+def file_handler(path: str, base_folder: str, same_device: bool = True, category: str = None) -> str:
     """ Processing each file based on the dictionary: renaming - by the normalize function
          create folder by dictionary key if missing
          moving the file to this folder, adding it to the list of known extensions depending on the dictionary key
@@ -34,90 +241,632 @@ def file_handler(path: Path):
          listing
          for unknown - create a list of unknown extensions
 
-    :param path: path
-    :return: make manipulation with files
+    :param path: path of the file
+    :param base_folder: folder to sort
+    :param same_device: the file is on the same device as base_folder
+    :param category: destination folder name, by default found by the extension
+    :return: new path of the file
     """
 
-    file_full_name = path.name
-    file_ext = file_full_name.split('.')[-1].lower()
-    new_folder_name = os.path.join(str(base_folder), 'Unknown')
-    for key, value in FILES_DICT.items():
-        # if the extension is present in the dictionary
-        if file_ext in value:
-            new_folder_name = os.path.join(str(base_folder), key)
+    file_full_name = os.path.basename(path)
+    new_folder_name = os.path.join(str(base_folder), category or get_folder_name(file_full_name))
     # create folder by dictionary key
-    os.makedirs(new_folder_name, exist_ok=True)
+    ensure_folder(new_folder_name)
     # create a new file path with a changed name
     new_file_path = os.path.join(new_folder_name, file_full_name)
     # move file to destination folder
-    shutil.move(str(path), new_file_path)
+    try:
+        move_file(str(path), new_file_path, same_device)
+    except FileNotFoundError:
+        if os.path.isdir(new_folder_name):
+            raise
+        # the folder was removed after it got into the cache
+        with created_folders_lock:
+            created_folders.discard(new_folder_name)
+        ensure_folder(new_folder_name)
+        move_file(str(path), new_file_path, same_device)
+    return new_file_path
 
 
-def get_dir_elements(path: Path):
+def folder_listed(folder: str, folder_stat, manifest: ScanManifest = None) -> bool:
+    """ the listing of the folder has to be read: no manifest or the folder changed since the last run
+
+    :param folder: path of the folder
+    :param folder_stat: stat of the folder
+    :param manifest: state of the folders after the last run
+    :return: bool
+    """
+    return manifest is None or not manifest.unchanged(folder, folder_stat)
+
+
+def read_folder(folder: str, listed: bool, manifest: ScanManifest = None):
+    """ elements of the folder: (path, stat, True) for subfolders to scan, (path, None, False) for files
+    a folder that is not listed gives only its known subfolders from the manifest
+
+    :param folder: path of the folder
+    :param listed: result of folder_listed
+    :param manifest: state of the folders after the last run
+    :return: generator
+    """
+    if not listed:
+        for subfolder in manifest.children(folder):
+            try:
+                subfolder_stat = os.stat(subfolder, follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.S_ISDIR(subfolder_stat.st_mode):
+                yield subfolder, subfolder_stat, True
+        return
+    with os.scandir(folder) as elements:
+        for element in elements:
+            # DirEntry keeps the type from the directory listing, no extra stat here
+            if element.is_dir(follow_symlinks=False):
+                if element.name in FILES_DICT or element.name == UNKNOWN_FOLDER:
+                    # do not touch folders from the dictionary
+                    continue
+                # one stat per folder: the device of the subtree and the state for the manifest
+                yield element.path, element.stat(follow_symlinks=False), True
+            elif element.is_file():
+                yield element.path, None, False
+
+
+def left_to_sort(folder: str, folders: dict) -> bool:
+    """ the folder has something the run did not take: a file or a subfolder that was not scanned
+
+    :param folder: path of the folder
+    :param folders: every scanned folder of the run
+    :return: bool
+    """
+    for element_path, _, is_dir in read_folder(folder, True):
+        if not is_dir or element_path not in folders:
+            return True
+    return False
+
+
+def move_one(path: str, base_folder: str, same_device: bool, stats: SortStats,
+             extractor: ArchiveExtractor = None, category: str = None):
+    """ move one file, count it and send archives to the extractor, errors are printed
+    every backend and the execution of a plan move files through it
+
+    :param path: path of the file
+    :param base_folder: folder to sort
+    :param same_device: the file is on the same device as base_folder
+    :param stats: counters of the run
+    :param extractor: pool unpacking archives or None
+    :param category: destination folder name, by default found by the extension
+    :return: None
+    """
+    try:
+        new_path = file_handler(path, base_folder, same_device, category)
+    except OSError as err:
+        print(f'Skip file {path}: {err}')
+        stats.folder_failed(os.path.dirname(path))
+        return
+    stats.file_moved()
+    if extractor is not None and (category or get_folder_name(os.path.basename(new_path))) == ARCHIVES_FOLDER:
+        extractor.submit(new_path)
+
+
+def get_dir_elements(path: Path, files_queue: Queue, stats: SortStats, workers: int = SCAN_WORKERS,
+                     manifest: ScanManifest = None) -> dict:
     """ we get access to all elements of the directory, taking into account attachments
+    a fixed pool of threads takes folders from the queue, each subfolder found is put back into the queue,
+    each file found is put into files_queue as soon as it is found together with the device of its folder
+    with the manifest a folder not changed since the last run is not listed, its known subfolders are checked
+    the function returns only after the whole tree is scanned
 
     :param path: path
-    :return: None
+    :param files_queue: queue for the moving threads
+    :param stats: counters of the run
+    :param workers: number of scanning threads
+    :param manifest: state of the folders after the last run
+    :return: every scanned folder -> its stat when the listing was read, None if it was not read
     """
-    global files_list
-    for element in path.iterdir():
-        # if is file:
-        if element.is_file():
-            # file_handler(element)  # do file processing
-            files_list.append(element)
-        # if folder:
-        if element.is_dir():
-            if element.name in FILES_DICT or not os.listdir(str(element)):
-                # do not touch empty and folders from the dictionary
+    dirs_queue = Queue()
+    folders = {}
+
+    def scan_worker():
+        while True:
+            item = dirs_queue.get()
+            if item is None:
+                dirs_queue.task_done()
+                break
+            folder, folder_stat = item
+            device = folder_stat.st_dev
+            listed = folder_listed(folder, folder_stat, manifest)
+            folders[folder] = folder_stat if listed else None
+            stats.folder_scanned(listed)
+            try:
+                for element_path, element_stat, is_dir in read_folder(folder, listed, manifest):
+                    if is_dir:
+                        dirs_queue.put((element_path, element_stat))
+                    else:
+                        files_queue.put((element_path, device))
+                        stats.file_found(files_queue.qsize())
+            except OSError as err:
+                print(f'Skip folder {folder}: {err}')
+                stats.folder_failed(folder)
+            finally:
+                dirs_queue.task_done()
+
+    root = os.path.abspath(path)
+    dirs_queue.put((root, os.stat(root)))
+    threads = [Thread(target=scan_worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    # scan complete: every folder put into the queue has been processed
+    dirs_queue.join()
+    for _ in threads:
+        dirs_queue.put(None)
+    for thread in threads:
+        thread.join()
+    return folders
+
+
+class AdaptiveMover:
+    """ Moving threads taking files from the queue, their number follows the measured speed:
+    it doubles while the speed grows, then goes up by one, and drops by a quarter when the speed falls
+    """
+
+    def __init__(self, files_queue: Queue, base_folder: str, stats: SortStats,
+                 min_workers: int = MIN_MOVE_WORKERS, max_workers: int = MAX_MOVE_WORKERS,
+                 extractor: ArchiveExtractor = None):
+        self.files_queue = files_queue
+        self.extractor = extractor
+        self.base_folder = base_folder
+        self.base_device = os.stat(base_folder).st_dev
+        self.stats = stats
+        self.min_workers = max(1, min(min_workers, max_workers))
+        self.max_workers = max(self.min_workers, max_workers)
+        self.lock = Lock()
+        self.workers = []
+        self.target = 0
+        self.retire = 0
+        self.stopping = Event()
+        self.controller = Thread(target=self.control, daemon=True)
+
+    def start(self):
+        self.resize(self.min_workers)
+        self.controller.start()
+
+    def resize(self, target: int):
+        """ Start new threads or ask running ones to finish
+
+        :param target: wanted number of threads
+        :return: None
+        """
+        with self.lock:
+            self.workers = [worker for worker in self.workers if worker.is_alive()]
+            active = len(self.workers) - self.retire
+            if target > active:
+                # threads waiting to retire are simply kept
+                cancel = min(self.retire, target - active)
+                self.retire -= cancel
+                for _ in range(target - active - cancel):
+                    worker = Thread(target=self.move_worker, daemon=True)
+                    worker.start()
+                    self.workers.append(worker)
+            else:
+                self.retire += active - target
+            self.target = target
+            self.stats.move_workers = target
+            self.stats.peak_move_workers = max(self.stats.peak_move_workers, target)
+
+    def control(self):
+        """ Hill climbing on files per second, measured every ADJUST_INTERVAL
+
+        :return: None
+        """
+        last_rate = 0.0
+        last_moved = self.stats.files_moved
+        last_time = monotonic()
+        slow_start = True
+        while not self.stopping.wait(ADJUST_INTERVAL):
+            now = monotonic()
+            moved = self.stats.files_moved
+            rate = (moved - last_moved) / (now - last_time)
+            last_moved, last_time = moved, now
+            if not self.files_queue.qsize():
+                # the movers wait for the scanner, more threads will not help
                 continue
-            # get_dir_elements(element)
-            Thread(target=get_dir_elements, args=(element,)).start()
-            # with ThreadPoolExecutor(max_workers=10) as executor:
-            #     executor.map(get_dir_elements, (element,))
-    # return files_list
+            target = self.target
+            if rate > last_rate * (1 + ADJUST_TOLERANCE):
+                target = target * 2 if slow_start else target + 1
+            elif rate < last_rate * (1 - ADJUST_TOLERANCE):
+                slow_start = False
+                target -= max(1, target // 4)
+            else:
+                slow_start = False
+            last_rate = rate
+            target = max(self.min_workers, min(self.max_workers, target))
+            if target != self.target:
+                self.resize(target)
+
+    def move_worker(self):
+        """ take files from the queue and move them until None is received or the pool shrinks
+
+        :return: None
+        """
+        while True:
+            with self.lock:
+                if self.retire:
+                    self.retire -= 1
+                    return
+            item = self.files_queue.get()
+            if item is None:
+                return
+            path, device = item
+            move_one(path, self.base_folder, device == self.base_device, self.stats, self.extractor)
+
+    def stop(self):
+        """ Wait until the queue is drained and all threads are finished
+
+        :return: None
+        """
+        self.stopping.set()
+        self.controller.join()
+        with self.lock:
+            self.retire = 0
+            workers = [worker for worker in self.workers if worker.is_alive()]
+        for _ in workers:
+            self.files_queue.put(None)
+        for worker in workers:
+            worker.join()
+
+
+def sort_folder_serial(path: Path, stats: SortStats, extractor: ArchiveExtractor = None,
+                       manifest: ScanManifest = None) -> dict:
+    """ Scan and move in one thread: each folder is read and then its files are moved
+
+    :param path: path
+    :param stats: counters of the run
+    :param extractor: pool unpacking archives or None
+    :param manifest: state of the folders after the last run
+    :return: every scanned folder -> its stat when the listing was read, None if it was not read
+    """
+    base_folder = str(path)
+    base_device = os.stat(base_folder).st_dev
+    root = os.path.abspath(path)
+    folders = {}
+    stack = [(root, os.stat(root))]
+    stats.move_workers = stats.peak_move_workers = 1
+    while stack:
+        folder, folder_stat = stack.pop()
+        listed = folder_listed(folder, folder_stat, manifest)
+        folders[folder] = folder_stat if listed else None
+        stats.folder_scanned(listed)
+        try:
+            # the listing is read before the files are moved out of the folder
+            elements = list(read_folder(folder, listed, manifest))
+        except OSError as err:
+            print(f'Skip folder {folder}: {err}')
+            stats.folder_failed(folder)
+            continue
+        for element_path, element_stat, is_dir in elements:
+            if is_dir:
+                stack.append((element_path, element_stat))
+            else:
+                stats.file_found(0)
+                move_one(element_path, base_folder, folder_stat.st_dev == base_device, stats, extractor)
+    return folders
+
+
+async def sort_folder_async(path: Path, stats: SortStats, extractor: ArchiveExtractor = None,
+                            manifest: ScanManifest = None,
+                            io_workers: int = IO_WORKERS, max_in_flight: int = MAX_IN_FLIGHT) -> dict:
+    """ Scan and move on the event loop: io_workers scanning tasks take folders from a queue like the
+    scanning threads, every move is a task, the blocking calls go to a small pool of threads.
+    A scanner puts the subfolders of its listing into the queue and waits for free places for its files,
+    up to max_in_flight moves at the same time. Only the scanners hold listings, so at most io_workers
+    of them are in memory, the folders waiting in the queue are kept as paths.
+
+    :param path: path
+    :param stats: counters of the run
+    :param extractor: pool unpacking archives or None
+    :param manifest: state of the folders after the last run
+    :param io_workers: threads for the blocking calls and number of scanning tasks
+    :param max_in_flight: max files in work
+    :return: every scanned folder -> its stat when the listing was read, None if it was not read
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=io_workers)
+    in_flight = asyncio.Semaphore(max_in_flight)
+    dirs_queue = asyncio.Queue()
+    base_folder = str(path)
+    base_device = os.stat(base_folder).st_dev
+    folders = {}
+    tasks = set()
+    stats.move_workers = stats.peak_move_workers = io_workers
+
+    def spawn(coroutine):
+        task = asyncio.create_task(coroutine)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def move(file_path: str, same_device: bool):
+        try:
+            await loop.run_in_executor(executor, move_one, file_path, base_folder, same_device, stats, extractor)
+        finally:
+            in_flight.release()
+
+    async def scan_worker():
+        while True:
+            folder, folder_stat = await dirs_queue.get()
+            try:
+                listed = folder_listed(folder, folder_stat, manifest)
+                folders[folder] = folder_stat if listed else None
+                stats.folder_scanned(listed)
+                try:
+                    elements = await loop.run_in_executor(executor,
+                                                          lambda: list(read_folder(folder, listed, manifest)))
+                except OSError as err:
+                    print(f'Skip folder {folder}: {err}')
+                    stats.folder_failed(folder)
+                    continue
+                same_device = folder_stat.st_dev == base_device
+                for element_path, element_stat, is_dir in elements:
+                    if is_dir:
+                        dirs_queue.put_nowait((element_path, element_stat))
+                    else:
+                        await in_flight.acquire()
+                        stats.file_found(len(tasks))
+                        spawn(move(element_path, same_device))
+            finally:
+                dirs_queue.task_done()
 
+    root = os.path.abspath(path)
+    dirs_queue.put_nowait((root, os.stat(root)))
+    scanners = [asyncio.create_task(scan_worker()) for _ in range(io_workers)]
+    try:
+        # scan complete: every folder put into the queue has been processed
+        await dirs_queue.join()
+        stats.scan_time = monotonic() - stats.start
+        while tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        for scanner in scanners:
+            scanner.cancel()
+        executor.shutdown(wait=True)
+    return folders
 
-def remove_empty_folder(path: Path):
+
+def remove_subtree_folders(folders: list) -> int:
+    """ try to delete every folder once, the deepest first: a folder is tried after all its subfolders
+
+    :param folders: folders of one subtree
+    :return: number of deleted folders
+    """
+    removed = 0
+    for folder in sorted(folders, key=lambda folder: folder.count(os.sep), reverse=True):
+        try:
+            os.rmdir(folder)  # delete folder if it is empty
+        except OSError:
+            continue
+        removed += 1
+    return removed
+
+
+def remove_empty_folder(path: Path, folders, workers: int = SCAN_WORKERS) -> int:
     """ remove all empty folder in path folder
+    only the folders found by the scan are tried, the top level subtrees are cleaned at the same time
 
     :param path: path
-    :return: None
+    :param folders: folders from get_dir_elements
+    :param workers: number of threads
+    :return: number of deleted folders
+    """
+    root = os.path.abspath(path)
+    subtrees = {}
+    for folder in folders:
+        if folder == root:
+            continue
+        top = os.path.relpath(folder, root).split(os.sep, 1)[0]
+        subtrees.setdefault(top, []).append(folder)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(remove_subtree_folders, subtrees.values()))
+
+
+def sort_folder(path: Path, max_workers: int = MAX_MOVE_WORKERS, extract: bool = True,
+                extract_workers: int = None, archive_size_limit: int = None,
+                manifest: ScanManifest = None, dedup: str = None, backend: str = 'threads') -> tuple:
+    """ Scan the folder and move files at the same time:
+    threads - the scanning threads put files into a bounded queue, the moving threads take them from it,
+    async - scanning tasks and a task per move on the event loop, blocking calls go to IO_WORKERS threads,
+    serial - everything in one thread;
+    moved archives are unpacked in a pool of processes
+
+    :param path: path
+    :param max_workers: ceiling for the number of moving threads
+    :param extract: unpack archives
+    :param extract_workers: number of processes for archives, by default the number of CPUs
+    :param archive_size_limit: max unpacked bytes for one archive
+    :param manifest: state of the folders after the last run, for incremental runs
+    :param dedup: 'report' to print copies of the same file in DEDUP_FOLDERS, 'link' to replace them with hardlinks
+    :param backend: 'threads', 'async' or 'serial'
+    :return: counters of the run and the scanned folders
     """
-    for element in path.iterdir():
-        if element.is_dir():
-            if not os.listdir(str(element)):
-                os.rmdir(str(element))  # delete folder
+    stats = SortStats()
+    extractor = ArchiveExtractor(extract_workers, archive_size_limit) if extract else None
+    if backend == 'async':
+        folders = asyncio.run(sort_folder_async(path, stats, extractor, manifest))
+    elif backend == 'serial':
+        folders = sort_folder_serial(path, stats, extractor, manifest)
+        stats.scan_time = monotonic() - stats.start
+    else:
+        files_queue = Queue(maxsize=FILES_QUEUE_SIZE)
+        mover = AdaptiveMover(files_queue, str(path), stats, max_workers=max_workers, extractor=extractor)
+        mover.start()
+        folders = get_dir_elements(path, files_queue, stats, manifest=manifest)
+        stats.scan_time = monotonic() - stats.start
+        mover.stop()
+    if extractor is not None:
+        extractor.close()
+        stats.archives_extracted = extractor.extracted
+        stats.archives_failed = extractor.failed
+        stats.extracted_bytes = extractor.extracted_bytes
+    if dedup:
+        groups = find_duplicates([os.path.join(str(path), folder) for folder in DEDUP_FOLDERS])
+        stats.duplicates = sum(len(paths) - 1 for _, paths in groups)
+        if dedup == 'link':
+            stats.duplicate_bytes = link_duplicates(groups)
+        else:
+            stats.duplicate_bytes = sum(size * (len(paths) - 1) for size, paths in groups)
+            for _, paths in groups:
+                for duplicate in paths[1:]:
+                    print(f'Duplicate {duplicate} of {paths[0]}')
+    stats.total_time = monotonic() - stats.start
+    return stats, folders
+
+
+def build_plan(path: Path, manifest: ScanManifest = None) -> MovePlan:
+    """ Scan the folder like the threads backend and record every move without touching the files,
+    name collisions are found in advance
+
+    :param path: path
+    :param manifest: state of the folders after the last run
+    :return: plan
+    """
+    plan = MovePlan(os.path.abspath(path), list(FILES_DICT) + [UNKNOWN_FOLDER])
+    files_queue = Queue(maxsize=FILES_QUEUE_SIZE)
+
+    def collect():
+        # the plan is filled by one thread only
+        while True:
+            item = files_queue.get()
+            if item is None:
+                break
+            plan.add(item[0], get_folder_name(os.path.basename(item[0])))
+
+    collector = Thread(target=collect, daemon=True)
+    collector.start()
+    folders = get_dir_elements(path, files_queue, SortStats(), manifest=manifest)
+    files_queue.put(None)
+    collector.join()
+    # folders without files are kept too, for the removal of empty folders after the execution
+    for folder in folders:
+        plan.add_folder(folder)
+    plan.find_collisions()
+    return plan
+
+
+def execute_plan(plan: MovePlan, workers: int = PLAN_WORKERS, extract: bool = True,
+                 extract_workers: int = None, archive_size_limit: int = None) -> tuple:
+    """ Move the files of a saved plan by batches of PLAN_BATCH in a pool of threads,
+    the collisions found by the plan are skipped
+
+    :param plan: plan from build_plan
+    :param workers: number of threads
+    :param extract: unpack archives
+    :param extract_workers: number of processes for archives
+    :param archive_size_limit: max unpacked bytes for one archive
+    :return: counters of the run and the folders of the plan
+    """
+    stats = SortStats()
+    stats.files_found = len(plan)
+    stats.move_workers = stats.peak_move_workers = workers
+    extractor = ArchiveExtractor(extract_workers, archive_size_limit) if extract else None
+    skip = set(plan.collisions)
+    base_device = os.stat(plan.base_folder).st_dev
+    devices = {}
+
+    def move_batch(start: int):
+        for index in range(start, min(start + PLAN_BATCH, len(plan))):
+            if index in skip:
                 continue
-            remove_empty_folder(element)
+            folder_index = plan.file_folders[index]
+            if folder_index not in devices:
+                try:
+                    devices[folder_index] = os.stat(plan.folders[folder_index]).st_dev
+                except OSError:
+                    devices[folder_index] = None
+            move_one(plan.source(index), plan.base_folder, devices[folder_index] == base_device, stats, extractor,
+                     plan.categories[plan.file_categories[index]])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(move_batch, range(0, len(plan), PLAN_BATCH)))
+    stats.scan_time = 0.0
+    if extractor is not None:
+        extractor.close()
+        stats.archives_extracted = extractor.extracted
+        stats.archives_failed = extractor.failed
+        stats.extracted_bytes = extractor.extracted_bytes
+    stats.total_time = monotonic() - stats.start
+    return stats, dict.fromkeys(plan.folders, True)
 
 
-def main(base_folder):
-    """ Main function: Normalize dictionary of extension to lower case
-    processes items from a folder
+def main(base_folder, max_workers: int = MAX_MOVE_WORKERS, extract: bool = True,
+         extract_workers: int = None, archive_size_limit: int = None, incremental: bool = False,
+         dedup: str = None, backend: str = 'threads'):
+    """ Main function: processes items from a folder
     remove empty folder
 
     :param base_folder: path
+    :param max_workers: ceiling for the number of moving threads
+    :param extract: unpack archives
+    :param extract_workers: number of processes for archives
+    :param archive_size_limit: max unpacked bytes for one archive
+    :param incremental: list only folders changed since the last run, keep the manifest next to the folder
+    :param dedup: None, 'report' or 'link'
+    :param backend: 'threads', 'async' or 'serial'
     :return: print result list from result_dictionary
     """
     path = Path(base_folder)
-    ext_dict_normalize(FILES_DICT)
-    start_list = monotonic()
-    get_dir_elements(path)
-    print(f'List create is {monotonic()-start_list}')
-    start_exec = monotonic()
-    with ThreadPoolExecutor(max_workers=10000) as executor:
-        executor.map(file_handler, files_list)
-    print(f'Executor time: {monotonic()-start_exec}')
-    remove_empty_folder(path)
+    manifest = ScanManifest(path) if incremental else None
+    stats, folders = sort_folder(path, max_workers, extract, extract_workers, archive_size_limit, manifest,
+                                 dedup, backend)
+    stats.folders_removed = remove_empty_folder(path, folders)
+    for key, value in stats.summary().items():
+        print(f'{key}: {value}')
+    if manifest is not None:
+        manifest.save(folders, lambda folder: left_to_sort(folder, folders), stats.failed_folders)
+        manifest.close()
 
 
 if __name__ == '__main__':
-    # base_folder = input('Enter folder for sort: ')
-    base_folder = 'd:\\Test\\'
+    parser = argparse.ArgumentParser(description='Sort files of the folder by extension')
+    parser.add_argument('base_folder', nargs='?', default='d:\\Test\\', help='folder for sort')
+    parser.add_argument('--backend', choices=('threads', 'async', 'serial'), default='threads',
+                        help='thread pools, asyncio event loop or one thread')
+    parser.add_argument('--max-workers', type=int, default=MAX_MOVE_WORKERS,
+                        help='ceiling for the number of moving threads')
+    parser.add_argument('--no-extract', action='store_true', help='move archives without unpacking')
+    parser.add_argument('--extract-workers', type=int, default=None,
+                        help='number of processes unpacking archives, the number of CPUs by default')
+    parser.add_argument('--archive-size-limit', type=int, default=None,
+                        help='max unpacked bytes for one archive, bigger archives are left packed')
+    parser.add_argument('--incremental', action='store_true',
+                        help='list only folders changed since the last run (manifest next to the folder)')
+    parser.add_argument('--plan', default=None, metavar='FILE',
+                        help='dry run: save the moves to FILE and print the summary, nothing is moved')
+    parser.add_argument('--execute-plan', default=None, metavar='FILE',
+                        help='move the files of a plan saved with --plan')
+    parser.add_argument('--dedup', choices=('report', 'link'), default=None,
+                        help='find copies of the same file in images and documents, report them or hardlink them')
+    args = parser.parse_args()
+    base_folder = args.base_folder
+    start = monotonic()
+    if args.execute_plan:
+        move_plan = MovePlan.load(args.execute_plan)
+        print(f'Plan: {len(move_plan)} files, {len(move_plan.collisions)} collisions skipped')
+        plan_stats, plan_folders = execute_plan(move_plan, min(args.max_workers, PLAN_WORKERS), not args.no_extract,
+                                                args.extract_workers, args.archive_size_limit)
+        plan_stats.folders_removed = remove_empty_folder(move_plan.base_folder, plan_folders)
+        for key, value in plan_stats.summary().items():
+            print(f'{key}: {value}')
+        print(f'Run time {monotonic()-start}')
+        exit()
     # check if the specified folder exists and is folder
     if not (os.path.exists(base_folder) and Path(base_folder).is_dir()):
         print('Path incorrect')
         exit()
-    start = monotonic()
-    main(base_folder)
+    if args.plan:
+        move_plan = build_plan(Path(base_folder), ScanManifest(base_folder) if args.incremental else None)
+        move_plan.save(args.plan)
+        for key, value in move_plan.summary().items():
+            print(f'{key}: {value}')
+        for index in move_plan.collisions:
+            print(f'Collision {move_plan.source(index)} -> {move_plan.destination(index)}')
+    else:
+        main(base_folder, args.max_workers, not args.no_extract, args.extract_workers, args.archive_size_limit,
+             args.incremental, args.dedup, args.backend)
     print(f'Run time {monotonic()-start}')
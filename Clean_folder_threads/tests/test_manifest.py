@@ -0,0 +1,105 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sort_folder_treads
+from manifest import ScanManifest
+
+BACKENDS = ('threads', 'async', 'serial')
+# mtime set on the test folders, far from the racy window of the manifest
+OLD_TIME = 1_000_000_000
+
+
+class TestIncrementalFailures(unittest.TestCase):
+
+    def setUp(self):
+        """
+        A temporary folder, every backend sorts its own folder in it.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self.temp = tempfile.TemporaryDirectory()
+        self.base = self.new_base('base')
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def new_base(self, name: str) -> str:
+        base = os.path.join(self.temp.name, name, 'base')
+        os.makedirs(os.path.join(base, 'sub'))
+        return base
+
+    def age_folders(self):
+        # only a real change makes a folder dirty
+        for folder, _, _ in os.walk(self.base):
+            os.utime(folder, (OLD_TIME, OLD_TIME))
+
+    def run_main(self, backend: str):
+        with contextlib.redirect_stdout(io.StringIO()):
+            sort_folder_treads.main(self.base, extract=False, incremental=True, backend=backend)
+
+    def sort_after_failure(self, backend: str, failure: str, target: str):
+        """
+        Run with one failure of read_folder or move_file for the target, then run again without it.
+
+        :param backend: backend of the runs
+        :param failure: 'read_folder' or 'move_file'
+        :param target: path that fails once
+        :return: None
+        """
+        original = getattr(sort_folder_treads, failure)
+
+        def fail_once(path, *args, **kwargs):
+            if path == target:
+                raise PermissionError(13, 'Permission denied', path)
+            return original(path, *args, **kwargs)
+
+        self.age_folders()
+        with patch.object(sort_folder_treads, failure, fail_once):
+            self.run_main(backend)
+        self.age_folders()
+        self.run_main(backend)
+
+    def test_failed_listing_is_listed_again(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                self.base = self.new_base(backend)
+                locked = os.path.join(self.base, 'sub')
+                open(os.path.join(locked, 'a.jpg'), 'w').close()
+                self.sort_after_failure(backend, 'read_folder', locked)
+                self.assertFalse(os.path.exists(os.path.join(locked, 'a.jpg')))
+                self.assertTrue(os.path.exists(os.path.join(self.base, 'images', 'a.jpg')))
+
+    def test_failed_move_is_retried(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                self.base = self.new_base(backend)
+                busy = os.path.join(self.base, 'sub', 'busy.jpg')
+                open(busy, 'w').close()
+                self.sort_after_failure(backend, 'move_file', busy)
+                self.assertFalse(os.path.exists(busy))
+                self.assertTrue(os.path.exists(os.path.join(self.base, 'images', 'busy.jpg')))
+
+    def test_failed_folder_is_saved_dirty(self):
+        folder = os.path.join(self.base, 'sub')
+        manifest = ScanManifest(self.base)
+        try:
+            manifest.save({folder: os.stat(folder)}, lambda path: False, {folder})
+        finally:
+            manifest.close()
+        manifest = ScanManifest(self.base)
+        try:
+            self.assertFalse(manifest.unchanged(folder, os.stat(folder)))
+        finally:
+            manifest.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
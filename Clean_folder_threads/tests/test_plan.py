@@ -0,0 +1,55 @@
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sort_folder_treads
+
+
+class TestExecutePlan(unittest.TestCase):
+
+    def setUp(self):
+        """
+        A folder to sort with an image and a document in a subfolder.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self.temp = tempfile.TemporaryDirectory()
+        self.base = os.path.join(self.temp.name, 'base')
+        os.makedirs(os.path.join(self.base, 'sub'))
+        for name in ('a.jpg', 'b.txt'):
+            open(os.path.join(self.base, 'sub', name), 'w').close()
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def execute(self):
+        plan = sort_folder_treads.build_plan(Path(self.base))
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats, _ = sort_folder_treads.execute_plan(plan, workers=2, extract=False)
+        return stats
+
+    def test_files_are_moved_by_category(self):
+        stats = self.execute()
+        self.assertEqual(stats.files_moved, 2)
+        self.assertTrue(os.path.exists(os.path.join(self.base, 'images', 'a.jpg')))
+        self.assertTrue(os.path.exists(os.path.join(self.base, 'documents', 'b.txt')))
+
+    def test_removed_category_folder_is_created_again(self):
+        # the folder stays in the cache of created folders after it is removed
+        sort_folder_treads.ensure_folder(os.path.join(self.base, 'images'))
+        shutil.rmtree(os.path.join(self.base, 'images'))
+        stats = self.execute()
+        self.assertEqual(stats.files_moved, 2)
+        self.assertTrue(os.path.exists(os.path.join(self.base, 'images', 'a.jpg')))
+
+
+if __name__ == '__main__':
+    unittest.main()
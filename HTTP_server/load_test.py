@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+from time import perf_counter, sleep
+
+HOST = '127.0.0.1'
+SERVER_PORT = 3000
+CLIENT_PORT = 5000
+PATHS = ['/', '/message', '/style.css', '/logo.png']
+CONNECTIONS = [1, 50, 500]
+FORM = 'username=load&message=test'
+
+
+def server_usage(pid: int) -> dict:
+    """ CPU seconds and open file descriptors of the server process, from /proc (Linux)
+
+    :param pid: process id of the server
+    :return: dict, empty if it can not be read
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as stat:
+            fields = stat.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        return {'cpu': (int(fields[11]) + int(fields[12])) / ticks, 'fds': len(os.listdir(f'/proc/{pid}/fd'))}
+    except OSError:
+        return {}
+
+
+async def read_response(reader) -> tuple:
+    """ Status and body length of one HTTP/1.1 response, the body is read and dropped
+
+    :param reader: asyncio stream
+    :return: (status, body bytes, keep-alive)
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length:
+        await reader.readexactly(length)
+    keep_alive = lines[0].startswith('HTTP/1.1') and headers.get('connection', '').lower() != 'close'
+    return status, length, keep_alive
+
+
+async def client(path: str, method: str, deadline: float, results: dict, extra_headers: str):
+    """ One connection sending requests one after another until the deadline, reconnecting when the server closes
+
+    :param path: requested path
+    :param method: GET or POST
+    :param deadline: perf_counter() value to stop at
+    :param results: shared lists of latencies, errors and bytes
+    :param extra_headers: header lines added to every request
+    :return: None
+    """
+    body = FORM.encode() if method == 'POST' else b''
+    request = (f'{method} {path} HTTP/1.1\r\nHost: {HOST}\r\n{extra_headers}'
+               + (f'Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n'
+                  if method == 'POST' else '')
+               + '\r\n').encode() + body
+    writer = None
+    while perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(HOST, SERVER_PORT)
+            start = perf_counter()
+            writer.write(request)
+            status, length, keep_alive = await read_response(reader)
+            results['latencies'].append(perf_counter() - start)
+            results['bytes'] += length
+            if status >= 400:
+                results['errors'] += 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            results['errors'] += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+async def sample_fds(pid: int, results: dict, interval: float = 0.5):
+    while True:
+        usage = server_usage(pid)
+        if usage:
+            results['server_fds_max'] = max(results.get('server_fds_max', 0), usage['fds'])
+        await asyncio.sleep(interval)
+
+
+async def run(path: str, method: str, connections: int, duration: float, extra_headers: str = '',
+              server_pid: int = None) -> dict:
+    results = {'latencies': [], 'errors': 0, 'bytes': 0}
+    sampler = asyncio.create_task(sample_fds(server_pid, results)) if server_pid else None
+    start = perf_counter()
+    await asyncio.gather(*(client(path, method, start + duration, results, extra_headers)
+                           for _ in range(connections)))
+    elapsed = perf_counter() - start
+    if sampler is not None:
+        sampler.cancel()
+    latencies = sorted(results['latencies'])
+    count = len(latencies)
+    return {'requests': count,
+            'errors': results['errors'],
+            'requests_per_sec': count / elapsed,
+            'mean_bytes': results['bytes'] / count if count else 0,
+            'p50_ms': statistics.median(latencies) * 1000 if count else None,
+            'p99_ms': latencies[min(count - 1, int(count * 0.99))] * 1000 if count else None,
+            # a connection waiting for a free server thread shows here even when it is under 1 %
+            'max_ms': latencies[-1] * 1000 if count else None,
+            **({'server_fds_max': results['server_fds_max']} if 'server_fds_max' in results else {})}
+
+
+def load_test(paths, connection_counts, duration: float, method: str = 'GET', server_pid: int = None,
+              extra_headers: str = '') -> list:
+    """ Every path at every number of concurrent connections
+
+    :param paths: paths to request
+    :param connection_counts: numbers of connections
+    :param duration: seconds of every run
+    :param method: GET or POST
+    :param server_pid: pid of the server for CPU and file descriptor usage
+    :param extra_headers: header lines added to every request
+    :return: list of results
+    """
+    rows = []
+    for path in paths:
+        for connections in connection_counts:
+            before = server_usage(server_pid) if server_pid else {}
+            row = {'path': path, 'method': method, 'connections': connections}
+            row.update(asyncio.run(run(path, method, connections, duration, extra_headers, server_pid)))
+            after = server_usage(server_pid) if server_pid else {}
+            if before and after and row['requests']:
+                row['server_cpu_us_per_request'] = (after['cpu'] - before['cpu']) / row['requests'] * 1e6
+                row['server_fds'] = after['fds']
+            print(' '.join(f'{key}={value:.2f}' if isinstance(value, float) else f'{key}={value}'
+                           for key, value in row.items()), flush=True)
+            rows.append(row)
+    return rows
+
+
+def udp_load(count: int, rate: float) -> dict:
+    """ Send the form straight to the UDP socket server, as do_POST does, at a fixed rate.
+    The server prints what it wrote, dropped and the latency of its commits.
+
+    :param count: datagrams
+    :param rate: datagrams per second, 0 sends as fast as possible
+    :return: dict
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect((HOST, CLIENT_PORT))
+    message = FORM.encode()
+    start = perf_counter()
+    sent = errors = 0
+    while sent < count:
+        for _ in range(min(1000, count - sent)):
+            try:
+                sock.send(message)
+            except OSError:
+                errors += 1
+            sent += 1
+        if rate:
+            ahead = start + sent / rate - perf_counter()
+            if ahead > 0:
+                sleep(ahead)
+    elapsed = perf_counter() - start
+    sock.close()
+    row = {'udp_messages': sent, 'errors': errors, 'seconds': elapsed, 'messages_per_sec': sent / elapsed}
+    print(' '.join(f'{key}={value:.2f}' if isinstance(value, float) else f'{key}={value}'
+                   for key, value in row.items()), flush=True)
+    return row
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the HTTP server: requests/s and latency')
+    parser.add_argument('--paths', nargs='+', default=PATHS)
+    parser.add_argument('--connections', type=int, nargs='+', default=CONNECTIONS)
+    parser.add_argument('--duration', type=float, default=10, help='seconds of every run')
+    parser.add_argument('--method', choices=['GET', 'POST'], default='GET', help='POST sends the form')
+    parser.add_argument('--header', action='append', default=[], help="extra header 'Name: value'")
+    parser.add_argument('--udp', type=int, default=0, help='send this many datagrams to the socket server instead')
+    parser.add_argument('--udp-rate', type=float, default=50_000, help='datagrams per second, 0 for no limit')
+    parser.add_argument('--server-pid', type=int, default=None, help='report CPU and open files of the server')
+    parser.add_argument('--json', default=None, help='write the results to this file')
+    args = parser.parse_args()
+
+    # 500 connections need more descriptors than the usual soft limit of 256 on macOS
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 4096)), hard))
+    except (ImportError, ValueError, OSError):
+        pass
+    if args.udp:
+        load_results = udp_load(args.udp, args.udp_rate)
+    else:
+        load_results = load_test(args.paths, args.connections, args.duration, args.method, args.server_pid,
+                                 ''.join(f'{header}\r\n' for header in args.header))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(load_results, file, indent=4)
@@ -1,105 +1,396 @@
-import mimetypes
-import pathlib
-from threading import Thread
+import argparse
+import email.utils
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Event, Thread
+from time import perf_counter
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import unquote_plus
+from urllib.parse import parse_qsl, unquote, urlsplit
+import signal
 import socket
-from datetime import datetime
-import json
+
+from response_cache import ResponseCache
+from static_files import FileCache, RangeNotSatisfiable, http_date, parse_range
+from storage import COMMIT_BATCH, COMMIT_INTERVAL, GroupCommitWriter, MessageLog, timestamp
+from udp_sender import BATCH_INTERVAL, SEPARATOR, UDPSender
 
 HOST = '127.0.0.1'
 SERVER_PORT = 3000
 CLIENT_PORT = 5000
+# threads serving connections, a keep-alive connection holds its thread until it is closed or idle
+MAX_THREADS = 1024
+# connections waiting in the kernel for accept()
+BACKLOG = 1024
+# seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 5
+# static files are served from the working directory
+ROOT = os.path.realpath(os.curdir)
+# biggest UDP payload, batches of forms are read whole
+MAX_DATAGRAM = 65507
+# kernel buffer of the UDP socket, it takes the bursts while the receiver is busy (capped by net.core.rmem_max)
+RECEIVE_BUFFER = 4 << 20
+# headers and the start of the body in one packet (Linux)
+MSG_MORE = getattr(socket, 'MSG_MORE', 0)
 
 
 class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between requests, every response needs Content-Length
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+    # headers and body are separate writes, with Nagle the body waits for the delayed ACK (40 ms)
+    disable_nagle_algorithm = True
+    log_requests = True
+    files = FileCache()
+    pages = ResponseCache()
+    sender = UDPSender((HOST, CLIENT_PORT))
 
-    def send_html_file(self, filename: str, status: int = 200):
-        self.send_response(status, )
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        with open(filename, 'rb') as file:
-            self.wfile.write(file.read())
+    def send_html_file(self, filename: str, status: int = 200, head: bool = False):
+        """ Page from the response cache in the encoding chosen by Accept-Encoding
+
+        :param filename: path of the page
+        :param status: 200 or the status of an error page
+        :param head: send only the headers
+        :return: None
+        """
+        try:
+            page = self.pages.get(filename)
+        except OSError:
+            if status == 404:
+                self.send_error(404)
+            else:
+                self.send_html_file('error.html', 404, head)
+            return
+        variant = page.choose(self.headers.get('Accept-Encoding', ''))
+        if status == 200 and self.not_modified(variant):
+            self.send_head(304, variant.validators)
+        else:
+            self.send_head(status, variant.headers, b'' if head else variant.body)
 
-    def do_GET(self):
-        url = self.path
+    def do_GET(self, head: bool = False):
+        url = unquote(urlsplit(self.path).path)
 
         match url:
             case '/':
-                self.send_html_file('index.html')
+                self.send_html_file('index.html', head=head)
             case '/message':
-                self.send_html_file('message.html')
+                self.send_html_file('message.html', head=head)
             case _:
-                if pathlib.Path().joinpath(url[1:]).exists():
-                    self.send_static()
+                path = os.path.normpath(os.path.join(ROOT, url.lstrip('/')))
+                if path.startswith(ROOT + os.sep):
+                    self.send_file(path, head=head)
                 else:
-                    self.send_html_file('error.html', 404)
+                    self.send_html_file('error.html', 404, head)
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
 
     def do_POST(self):
-        data: bytes = self.rfile.readline(int(self.headers['Content-Length']))
+        # the whole body is read, a rest of it would be taken for the next request of the connection
+        if 'Transfer-Encoding' in self.headers:
+            # chunked bodies are not read, send_error closes the connection
+            self.send_error(411)
+            return
+        try:
+            # no Content-Length means no body in HTTP/1.1
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            # read(-1) would wait for the client to close the connection
+            self.send_error(400, 'Bad Content-Length')
+            return
+        data: bytes = self.rfile.read(length)
+        if not self.send_data(data=data):
+            self.send_error(503, 'Message service unavailable')
+            return
         self.send_response(302)
-        self.send_data(data=data)
         self.send_header('Location', '/message')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
-    def send_data(self, data: bytes):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.connect((HOST, CLIENT_PORT))
-        sock.send(data)
+    def send_data(self, data: bytes) -> bool:
+        return self.sender.send(data)
 
-    def send_static(self):
-        self.send_response(200)
-        mt = mimetypes.guess_type(url=self.path)
-        if mt:
-            self.send_header("Content-type", mt[0])
-        else:
-            self.send_header("Content-type", 'text/plain')
-        self.end_headers()
-        with open(f'.{self.path}', 'rb') as file:
-            self.wfile.write(file.read())
+    def send_file(self, filename: str, status: int = 200, head: bool = False):
+        """ File from the open file cache: 304 when the client has it, 206 for a Range,
+        the body goes from the file to the socket with os.sendfile
 
+        :param filename: path of the file
+        :param status: 200 or the status of an error page
+        :param head: send only the headers
+        :return: None
+        """
+        try:
+            entry = self.files.acquire(filename)
+        except (OSError, ValueError):
+            # ValueError: a NUL byte from %00 in the path
+            if status == 404:
+                self.send_error(404)
+            else:
+                self.send_html_file('error.html', 404, head)
+            return
+        try:
+            first, last = 0, entry.size - 1
+            if status == 200:
+                if self.not_modified(entry):
+                    self.send_response(304)
+                    self.send_validators(entry)
+                    self.end_headers()
+                    return
+                range_header = self.headers.get('Range')
+                if range_header and self.headers.get('If-Range', entry.etag) in (entry.etag, entry.last_modified):
+                    try:
+                        byte_range = parse_range(range_header, entry.size)
+                    except RangeNotSatisfiable:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{entry.size}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    if byte_range is not None:
+                        status = 206
+                        first, last = byte_range
+            if status == 206:
+                headers = (f'Content-type: {entry.content_type}\r\nContent-Length: {last - first + 1}\r\n'
+                           f'Content-Range: bytes {first}-{last}/{entry.size}\r\nAccept-Ranges: bytes\r\n'
+                           f'ETag: {entry.etag}\r\nLast-Modified: {entry.last_modified}\r\n').encode('latin-1')
+            else:
+                headers = entry.headers
+            has_body = not head and last >= first
+            self.send_head(status, headers, more=has_body)
+            if has_body:
+                self.send_body(entry, first, last - first + 1)
+        finally:
+            self.files.release(entry)
 
-def run_web_server():
-    httpd = HTTPServer((HOST, SERVER_PORT), SimpleHTTPRequestHandler)
-    try:
-        httpd.serve_forever()
-        print('Running web server...')
-    except KeyboardInterrupt:
-        httpd.server_close()
+    def send_head(self, status: int, headers: bytes, body: bytes = b'', more: bool = False):
+        """ send_response(), send_header() and end_headers() in one send with the header lines prepared before
+
+        :param status: HTTP status
+        :param headers: header lines, each ends with CRLF
+        :param body: body sent in the same call
+        :param more: the body follows, the kernel may put it into the same packet
+        :return: None
+        """
+        self.log_request(status)
+        head = (f'{self.protocol_version} {status} {self.responses[status][0]}\r\n'
+                f'Server: {self.version_string()}\r\nDate: {http_date()}\r\n').encode('latin-1')
+        self.connection.sendall(head + headers + b'\r\n' + body, MSG_MORE if more else 0)
+
+    def send_body(self, entry, offset: int, count: int):
+        """ Bytes of the file from the page cache to the socket, without passing through python
+
+        :param entry: StaticFile
+        :param offset: first byte
+        :param count: number of bytes
+        :return: None
+        """
+        if not hasattr(os, 'sendfile'):
+            self.wfile.write(entry.read(offset, count))
+            return
+        try:
+            while count:
+                sent = os.sendfile(self.connection.fileno(), entry.file.fileno(), offset, count)
+                if not sent:
+                    break
+                offset += sent
+                count -= sent
+        except BlockingIOError:
+            # the socket buffer is full, socket.sendfile waits for it within the timeout
+            self.connection.sendfile(entry.file, offset, count)
+
+    def send_validators(self, entry):
+        self.send_header('ETag', entry.etag)
+        self.send_header('Last-Modified', entry.last_modified)
+
+    def not_modified(self, entry) -> bool:
+        """ If-None-Match wins over If-Modified-Since like in RFC 9110
+
+        :param entry: StaticFile
+        :return: bool
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in tags or entry.etag in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return entry.mtime <= since
+        return False
+
+    def log_message(self, format, *args):
+        if self.log_requests:
+            super().log_message(format, *args)
+
+
+class PooledHTTPServer(HTTPServer):
+    """ HTTPServer serving every connection in a thread of a fixed pool.
+    When all the threads are busy the accept loop waits, new connections stay in the kernel backlog.
+    """
+    def __init__(self, server_address, handler_class, max_threads: int = MAX_THREADS, backlog: int = BACKLOG):
+        self.request_queue_size = backlog
+        self.free_threads = BoundedSemaphore(max_threads)
+        self.pool = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='http')
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        self.free_threads.acquire()
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.free_threads.release()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
 
 
-def run_socket_server():
-    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server.bind((HOST, CLIENT_PORT))
+def web_server(server: str = 'pool', max_threads: int = MAX_THREADS, backlog: int = BACKLOG) -> HTTPServer:
+    if server == 'pool':
+        return PooledHTTPServer((HOST, SERVER_PORT), SimpleHTTPRequestHandler, max_threads, backlog)
+    # a kept-alive connection would block every other client of the single thread
+    SimpleHTTPRequestHandler.protocol_version = 'HTTP/1.0'
+    return HTTPServer((HOST, SERVER_PORT), SimpleHTTPRequestHandler)
+
+
+def close_web_server(httpd: HTTPServer):
+    """ Stop serve_forever() running in another thread and close the server and its caches
+
+    :param httpd: server
+    :return: None
+    """
+    httpd.shutdown()
+    httpd.server_close()
+    SimpleHTTPRequestHandler.files.close()
+    SimpleHTTPRequestHandler.pages.close()
+
+
+def udp_drops(port: int):
+    """ Datagrams dropped by the kernel for the UDP socket on the port, from /proc/net/udp (Linux)
+
+    :param port: local port
+    :return: int or None where it can not be read
+    """
     try:
-        while True:
-            data, address = server.recvfrom(1024)
-            print(f'Received data: {data.decode()} from: {address}')
-            write_in_json(data)
-    except KeyboardInterrupt:
+        with open('/proc/net/udp') as table:
+            for line in table.readlines()[1:]:
+                fields = line.split()
+                if int(fields[1].split(':')[1], 16) == port:
+                    return int(fields[-1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class SocketServer(Thread):
+    """ UDP receive loop in its own thread, the messages go to a GroupCommitWriter.
+    Only the main thread gets KeyboardInterrupt, so it calls stop(): an empty datagram wakes recvfrom,
+    the queued messages are written and the log is compacted into storage/data.json.
+    """
+
+    def __init__(self, batch: int = COMMIT_BATCH, interval: float = COMMIT_INTERVAL):
+        super().__init__(name='udp-server')
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        self.server.bind((HOST, CLIENT_PORT))
+        self.log = MessageLog()
+        self.writer = GroupCommitWriter(self.log, batch, interval, socket_drops=lambda: udp_drops(CLIENT_PORT))
+        self.stopping = Event()
+
+    def run(self):
+        self.writer.start()
+        while not self.stopping.is_set():
+            data, address = self.server.recvfrom(MAX_DATAGRAM)
+            received = perf_counter()
+            # a batch of UDPSender holds several forms
+            for message in data.split(SEPARATOR):
+                if message:
+                    write_in_json(message, self.writer, received)
+
+    def stop(self):
+        """ End the receive loop, write what is queued and compact the log
+
+        :return: None
+        """
+        self.stopping.set()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as wake:
+            # the wake-up datagram may be dropped when the receive buffer is full, it is sent until the loop ends
+            while self.is_alive():
+                wake.sendto(b'', (HOST, CLIENT_PORT))
+                self.join(0.1)
+        self.writer.stop()
+        print(f'{self.log.compact()} messages written to {self.log.snapshot_path}')
+        self.log.close()
+        self.server.close()
         print(f'Destroy server')
-    finally:
-        server.close()
 
 
-def write_in_json(data: bytes):
-    query_data: str = unquote_plus(data.decode())
-    data: dict = {key: value for key, value in [el.split('=') for el in query_data.split('&')]}
-    new_data: dict = {str(datetime.now()): data}
+def parse_message(data: bytes) -> dict:
+    """ Fields of the form sent by do_POST, values may contain '=' and '&' when they are quoted
+
+    :param data: urlencoded form
+    :return: dict
+    """
+    return dict(parse_qsl(data.decode(), keep_blank_values=True))
+
 
-    json_data: dict = json.load(open('storage\data.json'))
-    json_data.update(new_data)
+def write_in_json(data: bytes, writer: GroupCommitWriter, received: float):
+    """ Parse the message and queue it for the writer, the disk is not touched here
 
-    with open('storage\data.json', 'w') as file:
-        json.dump(json_data, file, indent=4)
-        print(f'Record was added to json.file\n')
+    :param data: urlencoded form
+    :param writer: writer of the log
+    :param received: perf_counter() when the datagram arrived
+    :return: None
+    """
+    try:
+        record = parse_message(data)
+    except (UnicodeDecodeError, ValueError) as err:
+        print(f'Skip message {data[:64]!r}: {err}')
+        return
+    writer.submit(timestamp(), record, received)
 
 
 if __name__ == '__main__':
-    socket_server = Thread(target=run_socket_server)
-    web_server = Thread(target=run_web_server)
+    parser = argparse.ArgumentParser(description='HTTP server with a form sent to a UDP socket server')
+    parser.add_argument('--server', choices=['pool', 'single'], default='pool',
+                        help="'pool' serves connections in a thread pool, 'single' one at a time")
+    parser.add_argument('--threads', type=int, default=MAX_THREADS, help='threads of the pool')
+    parser.add_argument('--backlog', type=int, default=BACKLOG, help='listen backlog')
+    parser.add_argument('--quiet', action='store_true', help='no access log')
+    parser.add_argument('--udp-batch', type=int, default=1, help='forms sent in one datagram at most')
+    parser.add_argument('--udp-batch-ms', type=float, default=BATCH_INTERVAL * 1000,
+                        help='milliseconds a datagram waits for more forms')
+    parser.add_argument('--commit-batch', type=int, default=COMMIT_BATCH, help='messages in one disk commit at most')
+    parser.add_argument('--commit-ms', type=float, default=COMMIT_INTERVAL * 1000,
+                        help='milliseconds a commit waits for more messages')
+    args = parser.parse_args()
+    SimpleHTTPRequestHandler.log_requests = not args.quiet
+    if args.udp_batch > 1:
+        SimpleHTTPRequestHandler.sender = UDPSender((HOST, CLIENT_PORT), args.udp_batch, args.udp_batch_ms / 1000)
+
+    # docker stop sends SIGTERM, the servers are stopped like on Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    httpd = web_server(args.server, args.threads, args.backlog)
+    socket_server = SocketServer(args.commit_batch, args.commit_ms / 1000)
+    web_thread = Thread(target=httpd.serve_forever, name='web-server')
 
-    web_server.start()
+    print(f'Running web server ({args.server})...')
+    web_thread.start()
     socket_server.start()
-    web_server.join()
-    socket_server.join()
+    try:
+        web_thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_web_server(httpd)
+        socket_server.stop()
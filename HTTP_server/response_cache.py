@@ -0,0 +1,145 @@
+import email.utils
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# seconds between two checks of the cached pages on disk
+STAT_INTERVAL = 1.0
+# preferred first when the client accepts several with the same q
+PREFERENCE = ('br', 'gzip', 'identity')
+
+
+class PageVariant:
+    """ One encoding of a page with the header lines of its responses """
+
+    def __init__(self, body: bytes, encoding: str, content_type: str, digest: str, mtime: int):
+        self.body = body
+        self.mtime = mtime
+        # strong ETags differ between the encodings of the same content
+        self.etag = f'"{digest}"' if encoding == 'identity' else f'"{digest}-{encoding}"'
+        self.last_modified = email.utils.formatdate(mtime, usegmt=True)
+        self.validators = (f'ETag: {self.etag}\r\nLast-Modified: {self.last_modified}\r\n'
+                           'Vary: Accept-Encoding\r\n').encode('latin-1')
+        self.headers = (f'Content-type: {content_type}\r\nContent-Length: {len(body)}\r\n'
+                        + ('' if encoding == 'identity' else f'Content-Encoding: {encoding}\r\n')
+                        ).encode('latin-1') + self.validators
+
+
+class CachedPage:
+    """ A file read once with its gzip and brotli variants, only the ones smaller than the raw bytes are kept """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            stat_result = os.fstat(file.fileno())
+            raw = file.read()
+        self.stat_key = (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+        content_type = mimetypes.guess_type(path)[0] or 'text/plain'
+        digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        mtime = int(stat_result.st_mtime)
+        bodies = {'identity': raw, 'gzip': gzip.compress(raw, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            bodies['br'] = brotli.compress(raw, quality=11)
+        self.variants = {encoding: PageVariant(body, encoding, content_type, digest, mtime)
+                         for encoding, body in bodies.items() if encoding == 'identity' or len(body) < len(raw)}
+        self.choices = {}
+
+    def choose(self, accept_encoding: str) -> PageVariant:
+        """ The variant for the Accept-Encoding header, the answer is remembered for the same header
+
+        :param accept_encoding: value of the header
+        :return: PageVariant
+        """
+        variant = self.choices.get(accept_encoding)
+        if variant is None:
+            variant = self.choices[accept_encoding] = self.variants[negotiate(accept_encoding, self.variants)]
+            if len(self.choices) > 64:
+                self.choices.clear()
+        return variant
+
+
+def negotiate(accept_encoding: str, available) -> str:
+    """ The best available encoding for Accept-Encoding with q values and '*'.
+    identity is used when nothing else is acceptable, as servers usually do.
+
+    :param accept_encoding: value of the header
+    :param available: encodings that can be sent
+    :return: encoding
+    """
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    default = weights.get('*', 0.0)
+    best, best_q = 'identity', 0.0
+    for encoding in PREFERENCE:
+        if encoding not in available or encoding == 'identity':
+            continue
+        q = weights.get(encoding, default)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class ResponseCache:
+    """ Pages kept in memory by path. A thread checks the files with os.stat every stat_interval seconds
+    and reloads the changed ones, so a request for a cached page does no file I/O at all.
+    """
+
+    def __init__(self, stat_interval: float = STAT_INTERVAL):
+        self.stat_interval = stat_interval
+        self.pages = {}
+        self.lock = threading.Lock()
+        self.watcher = None
+        self.stopped = threading.Event()
+
+    def get(self, path: str) -> CachedPage:
+        """ The cached page, it is loaded on the first request
+
+        :param path: path of the file
+        :return: CachedPage, OSError if the file can not be read
+        """
+        page = self.pages.get(path)
+        if page is None:
+            page = CachedPage(path)
+            with self.lock:
+                self.pages[path] = page
+                if self.watcher is None:
+                    self.watcher = threading.Thread(target=self.watch, name='page-watcher', daemon=True)
+                    self.watcher.start()
+        return page
+
+    def watch(self):
+        while not self.stopped.wait(self.stat_interval):
+            for path, page in list(self.pages.items()):
+                try:
+                    stat_result = os.stat(path)
+                    if (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns) == page.stat_key:
+                        continue
+                    page = CachedPage(path)
+                except OSError:
+                    page = None
+                with self.lock:
+                    if page is None:
+                        self.pages.pop(path, None)
+                    else:
+                        self.pages[path] = page
+
+    def close(self):
+        self.stopped.set()
@@ -0,0 +1,181 @@
+from collections import OrderedDict
+import email.utils
+import hashlib
+import mimetypes
+import os
+import threading
+from time import monotonic, time
+
+# open files kept by FileCache, the least recently used is closed above it
+MAX_OPEN_FILES = 256
+# seconds between two checks of a cached file on disk
+STAT_INTERVAL = 1.0
+HASH_CHUNK = 1 << 20
+
+
+_date = (0, '')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def http_date() -> str:
+    """ Date header of the current second, formatted once a second
+
+    :return: str
+    """
+    global _date
+    now = int(time())
+    if _date[0] != now:
+        _date = (now, email.utils.formatdate(now, usegmt=True))
+    return _date[1]
+
+
+class StaticFile:
+    """ An open file with everything its responses need, computed once when it is opened.
+    The threads share the descriptor, os.sendfile reads at an explicit offset, so no seek is shared.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb', buffering=0)
+        try:
+            stat_result = os.fstat(self.file.fileno())
+            digest = hashlib.blake2b(digest_size=16)
+            while chunk := self.file.read(HASH_CHUNK):
+                digest.update(chunk)
+        except OSError:
+            self.file.close()
+            raise
+        self.stat_key = (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+        self.size = stat_result.st_size
+        self.mtime = int(stat_result.st_mtime)
+        # strong: the hash of the content changes with every byte
+        self.etag = f'"{digest.hexdigest()}"'
+        self.last_modified = email.utils.formatdate(self.mtime, usegmt=True)
+        self.content_type = mimetypes.guess_type(path)[0] or 'text/plain'
+        # header lines of a 200 response, formatted once
+        self.headers = (f'Content-type: {self.content_type}\r\nContent-Length: {self.size}\r\n'
+                        f'Accept-Ranges: bytes\r\nETag: {self.etag}\r\nLast-Modified: {self.last_modified}\r\n'
+                        ).encode('latin-1')
+        self.checked = monotonic()
+        self.users = 0
+        self.retired = False
+        self.lock = threading.Lock()
+
+    def read(self, offset: int, count: int) -> bytes:
+        """ Bytes of the file for platforms without os.sendfile
+
+        :param offset: first byte
+        :param count: number of bytes
+        :return: bytes
+        """
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(count)
+
+
+class FileCache:
+    """ Open static files by path, the least recently used are closed above max_open.
+    A file is checked with os.stat at most every stat_interval seconds and reopened when it changed.
+    acquire() and release() count the users, a replaced file is closed when its last response is sent.
+    """
+
+    def __init__(self, max_open: int = MAX_OPEN_FILES, stat_interval: float = STAT_INTERVAL):
+        self.max_open = max_open
+        self.stat_interval = stat_interval
+        self.files = OrderedDict()
+        self.lock = threading.Lock()
+
+    def acquire(self, path: str) -> StaticFile:
+        """ The open file, release() it after the response
+
+        :param path: path of the file
+        :return: StaticFile, OSError if it can not be opened, ValueError for a path with a NUL byte
+        """
+        entry = self.lookup(path)
+        if entry is not None:
+            return entry
+        entry = StaticFile(path)
+        with self.lock:
+            old = self.files.get(path)
+            if old is not None:
+                self.retire(old)
+            self.files[path] = entry
+            while len(self.files) > self.max_open:
+                self.retire(self.files.popitem(last=False)[1])
+            entry.users += 1
+        return entry
+
+    def lookup(self, path: str):
+        with self.lock:
+            entry = self.files.get(path)
+            if entry is None:
+                return None
+            if monotonic() - entry.checked < self.stat_interval:
+                self.files.move_to_end(path)
+                entry.users += 1
+                return entry
+        try:
+            stat_result = os.stat(path)
+            stat_key = (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+        except OSError:
+            stat_key = None
+        with self.lock:
+            if self.files.get(path) is not entry:
+                return None
+            if stat_key == entry.stat_key:
+                entry.checked = monotonic()
+                self.files.move_to_end(path)
+                entry.users += 1
+                return entry
+            del self.files[path]
+            self.retire(entry)
+        return None
+
+    def release(self, entry: StaticFile):
+        with self.lock:
+            entry.users -= 1
+            if entry.retired and entry.users == 0:
+                entry.file.close()
+
+    def retire(self, entry: StaticFile):
+        # called with the lock held
+        entry.retired = True
+        if entry.users == 0:
+            entry.file.close()
+
+    def close(self):
+        with self.lock:
+            while self.files:
+                self.retire(self.files.popitem()[1])
+
+
+def parse_range(header: str, size: int):
+    """ A single 'bytes=' range of the Range header. Other units, several ranges
+    and malformed headers are ignored, the whole file is sent for them.
+
+    :param header: value of the Range header
+    :param size: size of the file
+    :return: (first, last) byte or None, RangeNotSatisfiable if it is outside the file
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if first == '':
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start > end:
+        if last and int(last) < start:
+            return None
+        raise RangeNotSatisfiable(header)
+    return start, end
@@ -0,0 +1,340 @@
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+import json
+import os
+from queue import Empty, Full, Queue
+import threading
+from time import monotonic, perf_counter
+
+STORAGE_DIR = 'storage'
+SNAPSHOT_PATH = os.path.join(STORAGE_DIR, 'data.json')
+LOG_PATH = os.path.join(STORAGE_DIR, 'data.jsonl')
+# records written between two fsync calls at most
+FSYNC_BATCH = 256
+# seconds an appended record may wait for fsync
+FSYNC_INTERVAL = 0.05
+# records in one commit of GroupCommitWriter at most
+COMMIT_BATCH = 2048
+# seconds a commit waits for more records after the first one
+COMMIT_INTERVAL = 0.005
+# records waiting for the writer, new ones are dropped above it
+QUEUE_SIZE = 100_000
+# seconds between two metrics lines of the writer
+METRICS_INTERVAL = 5
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def timestamp() -> str:
+    """ Key of a new record in the format of data.json, microseconds are always written
+
+    :return: str
+    """
+    return datetime.now().isoformat(sep=' ', timespec='microseconds')
+
+
+def time_key(time) -> int:
+    """ Microseconds since 1970 of a record time, used by the index
+
+    :param time: str in the format of timestamp() or datetime
+    :return: int
+    """
+    if isinstance(time, str):
+        time = datetime.fromisoformat(time)
+    return (time.replace(tzinfo=None) - EPOCH) // MICROSECOND
+
+
+class MessageLog:
+    """ Messages appended to a JSON-lines log, one line {"time": ..., "data": {...}} per message.
+    A message costs one buffered write whatever the size of the log, the writes are flushed and fsynced
+    together every fsync_batch records or fsync_interval seconds. A torn last line left by a crash
+    is cut off on open. The offsets of the lines are indexed by time for read().
+    The log is the storage, compact() turns it into the snapshot in the old data.json format.
+    """
+
+    def __init__(self, path: str = LOG_PATH, snapshot_path: str = SNAPSHOT_PATH,
+                 fsync_batch: int = FSYNC_BATCH, fsync_interval: float = FSYNC_INTERVAL):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.keys = array('q')
+        self.offsets = array('Q')
+        self.size = 0
+        self.pending = 0
+        self.last_sync = monotonic()
+        new_log = not os.path.exists(path)
+        self.file = open(path, 'a+b')
+        self.recover()
+        if new_log and os.path.exists(snapshot_path):
+            # the records saved before the log existed
+            with open(snapshot_path, encoding='utf-8') as file:
+                for time, data in json.load(file).items():
+                    self.append(time, data)
+            self.sync()
+
+    def recover(self):
+        """ Index the lines of the log, a last line without its end is cut off
+
+        :return: None
+        """
+        self.file.seek(0)
+        offset = 0
+        for line in self.file:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                self.index(time_key(json.loads(line)['time']), offset)
+            except (ValueError, KeyError, TypeError):
+                print(f'Skip broken record at {offset} in {self.path}')
+            offset += len(line)
+        self.file.truncate(offset)
+        self.size = offset
+
+    def index(self, key: int, offset: int):
+        if not self.keys or key >= self.keys[-1]:
+            self.keys.append(key)
+            self.offsets.append(offset)
+        else:
+            # the clock went back
+            position = bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.offsets.insert(position, offset)
+
+    def append(self, time: str, data: dict):
+        """ Add a record, it is on disk after the next sync
+
+        :param time: key of the record, see timestamp()
+        :param data: fields of the message
+        :return: None
+        """
+        line = json.dumps({'time': time, 'data': data}, ensure_ascii=False).encode() + b'\n'
+        key = time_key(time)
+        with self.lock:
+            self.file.write(line)
+            self.index(key, self.size)
+            self.size += len(line)
+            self.pending += 1
+            if self.pending >= self.fsync_batch or monotonic() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def append_batch(self, records, sync: bool = True):
+        """ Add many records with one write and, by default, one fsync
+
+        :param records: list of (time, data)
+        :param sync: fsync the batch before returning
+        :return: None
+        """
+        lines = [json.dumps({'time': time, 'data': data}, ensure_ascii=False).encode() + b'\n'
+                 for time, data in records]
+        keys = [time_key(time) for time, _ in records]
+        with self.lock:
+            self.file.write(b''.join(lines))
+            for key, line in zip(keys, lines):
+                self.index(key, self.size)
+                self.size += len(line)
+            self.pending += len(lines)
+            if sync:
+                self._sync()
+
+    def sync(self):
+        """ fsync the appended records, a record waits fsync_interval at most when it is called that often
+
+        :return: None
+        """
+        with self.lock:
+            if self.pending:
+                self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = monotonic()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def read(self, since=None, until=None):
+        """ Records with since <= time <= until in the order of time
+
+        :param since: str or datetime, from the first record by default
+        :param until: str or datetime, to the last record by default
+        :return: generator of (time, data)
+        """
+        with self.lock:
+            self.file.flush()
+            first = 0 if since is None else bisect_left(self.keys, time_key(since))
+            last = len(self.keys) if until is None else bisect_right(self.keys, time_key(until))
+            offsets = self.offsets[first:last]
+        with open(self.path, 'rb') as file:
+            for offset in offsets:
+                file.seek(offset)
+                record = json.loads(file.readline())
+                yield record['time'], record['data']
+
+    def compact(self):
+        """ Write every record into the snapshot in the format of data.json. The snapshot is written
+        record by record into a new file that replaces the old one, a crash leaves the old snapshot.
+
+        :return: number of records
+        """
+        self.sync()
+        temp_path = f'{self.snapshot_path}.tmp'
+        count = 0
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write('{')
+            for time, data in self.read():
+                # the same text as json.dump(records, file, indent=4)
+                file.write(',\n    ' if count else '\n    ')
+                file.write(f'{json.dumps(time)}: {json.dumps(data, indent=4).replace(chr(10), chr(10) + "    ")}')
+                count += 1
+            file.write('\n}' if count else '}')
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        return count
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+class GroupCommitWriter(threading.Thread):
+    """ Records from a queue written to the log in batches: a commit takes what is waiting,
+    up to batch records, and waits for more at most interval seconds after the first one,
+    then writes them with one write and one fsync. The receiving thread never touches the disk.
+    Every counter is changed by one thread only: submit() by the receiver, the rest by the writer.
+    """
+
+    def __init__(self, log: MessageLog, batch: int = COMMIT_BATCH, interval: float = COMMIT_INTERVAL,
+                 queue_size: int = QUEUE_SIZE, metrics_interval: float = METRICS_INTERVAL, socket_drops=None):
+        super().__init__(name='log-writer', daemon=True)
+        self.log = log
+        self.batch = batch
+        self.interval = interval
+        self.queue = Queue(queue_size)
+        self.metrics_interval = metrics_interval
+        # callable returning the datagrams dropped by the kernel, or None
+        self.socket_drops = socket_drops
+        self.received = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def submit(self, time: str, data: dict, received: float) -> bool:
+        """ Queue a record without waiting
+
+        :param time: key of the record
+        :param data: fields of the message
+        :param received: perf_counter() when the message arrived
+        :return: False if the queue is full and the record is dropped
+        """
+        self.received += 1
+        try:
+            self.queue.put_nowait((time, data, received))
+        except Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def stop(self):
+        """ Write what is queued and end the thread
+
+        :return: None
+        """
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        last_report = monotonic()
+        reported = (0, 0, 0, 0.0)
+        running = True
+        while running:
+            try:
+                item = self.queue.get(timeout=self.metrics_interval)
+            except Empty:
+                item = ()
+            batch = []
+            deadline = perf_counter() + self.interval
+            while item is not None:
+                if item:
+                    batch.append(item)
+                # checked before the next get, a record taken from the queue always goes into a batch
+                if len(batch) >= self.batch:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except Empty:
+                    remaining = deadline - perf_counter()
+                    if not batch or remaining <= 0:
+                        break
+                    try:
+                        item = self.queue.get(timeout=remaining)
+                    except Empty:
+                        break
+            if item is None:
+                running = False
+            if batch:
+                self.commit(batch)
+            if monotonic() - last_report >= self.metrics_interval:
+                reported = self.report(reported, monotonic() - last_report)
+                last_report = monotonic()
+
+    def commit(self, batch: list):
+        self.log.append_batch([(time, data) for time, data, _ in batch])
+        done = perf_counter()
+        self.written += len(batch)
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        self.latency_sum += done * len(batch) - sum(received for _, _, received in batch)
+        self.latency_max = max(self.latency_max, done - batch[0][2])
+
+    def report(self, reported: tuple, elapsed: float) -> tuple:
+        """ Print the metrics since the previous line when there were messages
+
+        :param reported: counters of the previous line
+        :param elapsed: seconds since the previous line
+        :return: counters of this line
+        """
+        written, batches, dropped, latency_sum = reported
+        count = self.written - written
+        current = (self.written, self.batches, self.dropped, self.latency_sum)
+        if not count and self.dropped == dropped:
+            return current
+        socket_drops = self.socket_drops() if self.socket_drops is not None else None
+        print(f'UDP: {count / elapsed:.0f} msg/s written, queue {self.queue.qsize()}, '
+              f'batch avg {count / max(self.batches - batches, 1):.1f} max {self.max_batch}, '
+              f'dropped {self.dropped} queue / {socket_drops if socket_drops is not None else "?"} socket, '
+              f'latency avg {(self.latency_sum - latency_sum) / max(count, 1) * 1000:.2f} ms '
+              f'max {self.latency_max * 1000:.2f} ms', flush=True)
+        self.max_batch = 0
+        self.latency_max = 0.0
+        return current
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Message log of the socket server')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('compact', help='write the log into storage/data.json')
+    read = commands.add_parser('read', help='print the records between two times')
+    read.add_argument('--since', default=None, help="e.g. '2022-12-21 23:00:00'")
+    read.add_argument('--until', default=None)
+    args = parser.parse_args()
+
+    log = MessageLog()
+    try:
+        if args.command == 'compact':
+            print(f'{log.compact()} records written to {log.snapshot_path}')
+        elif args.command == 'read':
+            for record_time, record_data in log.read(args.since, args.until):
+                print(record_time, json.dumps(record_data, ensure_ascii=False))
+    finally:
+        log.close()
@@ -0,0 +1,76 @@
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import CachedPage, brotli, negotiate
+
+ALL = ('identity', 'gzip', 'br')
+
+
+class TestNegotiate(unittest.TestCase):
+
+    def test_accept_encoding(self):
+        cases = {'': 'identity',
+                 'identity': 'identity',
+                 'gzip': 'gzip',
+                 'GZIP': 'gzip',
+                 'gzip, deflate, br': 'br',
+                 'br;q=0.5, gzip': 'gzip',
+                 'gzip;q=0.8, br;q=0.9': 'br',
+                 'gzip;q=0': 'identity',
+                 'gzip;q=abc': 'identity',
+                 'deflate': 'identity',
+                 '*': 'br',
+                 '*;q=0.5, br;q=0': 'gzip',
+                 ' , gzip ,': 'gzip'}
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(negotiate(header, ALL), expected)
+
+    def test_only_available_encodings(self):
+        self.assertEqual(negotiate('br, gzip', ('identity', 'gzip')), 'gzip')
+        self.assertEqual(negotiate('br', ('identity', 'gzip')), 'identity')
+
+
+class TestCachedPage(unittest.TestCase):
+
+    def setUp(self):
+        """
+        A page big enough for every encoding to be smaller than the raw bytes.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'page.html')
+        self.raw = b'<p>cached page</p>\n' * 200
+        with open(self.path, 'wb') as file:
+            file.write(self.raw)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_variants(self):
+        page = CachedPage(self.path)
+        self.assertEqual(page.variants['identity'].body, self.raw)
+        self.assertEqual(gzip.decompress(page.variants['gzip'].body), self.raw)
+        if brotli is not None:
+            self.assertEqual(brotli.decompress(page.variants['br'].body), self.raw)
+        etags = [variant.etag for variant in page.variants.values()]
+        self.assertEqual(len(set(etags)), len(etags))
+        self.assertIn(b'Content-Encoding: gzip\r\n', page.variants['gzip'].headers)
+        self.assertNotIn(b'Content-Encoding', page.variants['identity'].headers)
+
+    def test_choose(self):
+        page = CachedPage(self.path)
+        self.assertIs(page.choose('gzip'), page.variants['gzip'])
+        self.assertIs(page.choose(''), page.variants['identity'])
+        self.assertIs(page.choose('br, gzip'), page.variants['br' if brotli is not None else 'gzip'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import email.utils
+import http.client
+import os
+import sys
+import threading
+import unittest
+
+HTTP_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HTTP_SERVER_DIR)
+
+import main
+from static_files import RangeNotSatisfiable, parse_range
+
+
+class TestParseRange(unittest.TestCase):
+
+    def test_ranges(self):
+        cases = {'bytes=0-99': (0, 99),
+                 'bytes=500-': (500, 999),
+                 'bytes=900-2000': (900, 999),
+                 'bytes=999-999': (999, 999),
+                 ' bytes = 10-19': (10, 19),
+                 # suffix: the last bytes, the whole file when it is longer
+                 'bytes=-100': (900, 999),
+                 'bytes=-2000': (0, 999)}
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 1000), expected)
+
+    def test_ignored(self):
+        # the whole file is sent for them
+        for header in ('bytes=5-3', 'bytes=0-1,5-6', 'items=0-1', 'bytes=abc', 'bytes=1-x', 'bytes'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1000))
+
+    def test_not_satisfiable(self):
+        for header, size in (('bytes=1000-', 1000), ('bytes=1000-1200', 1000), ('bytes=-0', 1000),
+                             ('bytes=0-', 0), ('bytes=-5', 0)):
+            with self.subTest(header=header, size=size):
+                with self.assertRaises(RangeNotSatisfiable):
+                    parse_range(header, size)
+
+
+class TestSendFile(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        The web server on a free port serving the files of HTTP_server.
+
+        :param cls: Represent the class
+        :return: None
+        """
+        main.ROOT = HTTP_SERVER_DIR
+        main.SimpleHTTPRequestHandler.log_requests = False
+        cls.httpd = main.PooledHTTPServer(('127.0.0.1', 0), main.SimpleHTTPRequestHandler, max_threads=4)
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+        with open(os.path.join(HTTP_SERVER_DIR, 'style.css'), 'rb') as file:
+            cls.content = file.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        main.SimpleHTTPRequestHandler.files.close()
+
+    def get(self, path: str = '/style.css', **headers):
+        connection = http.client.HTTPConnection('127.0.0.1', self.httpd.server_address[1], timeout=5)
+        try:
+            connection.request('GET', path, headers={key.replace('_', '-'): value for key, value in headers.items()})
+            response = connection.getresponse()
+            return response, response.read()
+        finally:
+            connection.close()
+
+    def test_full_file(self):
+        response, body = self.get()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response.getheader('Accept-Ranges'), 'bytes')
+        self.assertTrue(response.getheader('ETag'))
+
+    def test_if_none_match(self):
+        etag = self.get()[0].getheader('ETag')
+        self.assertEqual(self.get(If_None_Match=etag)[0].status, 304)
+        self.assertEqual(self.get(If_None_Match=f'"other", W/{etag}')[0].status, 304)
+        self.assertEqual(self.get(If_None_Match='"other"')[0].status, 200)
+
+    def test_if_none_match_wins_over_if_modified_since(self):
+        future = email.utils.formatdate(2 ** 31, usegmt=True)
+        self.assertEqual(self.get(If_Modified_Since=future)[0].status, 304)
+        self.assertEqual(self.get(If_None_Match='"other"', If_Modified_Since=future)[0].status, 200)
+        past = email.utils.formatdate(0, usegmt=True)
+        self.assertEqual(self.get(If_Modified_Since=past)[0].status, 200)
+        self.assertEqual(self.get(If_Modified_Since='not a date')[0].status, 200)
+
+    def test_range(self):
+        response, body = self.get(Range='bytes=0-9')
+        self.assertEqual(response.status, 206)
+        self.assertEqual(body, self.content[:10])
+        self.assertEqual(response.getheader('Content-Range'), f'bytes 0-9/{len(self.content)}')
+        response, body = self.get(Range='bytes=-5')
+        self.assertEqual((response.status, body), (206, self.content[-5:]))
+
+    def test_range_not_satisfiable(self):
+        response, body = self.get(Range=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status, 416)
+        self.assertEqual(response.getheader('Content-Range'), f'bytes */{len(self.content)}')
+        self.assertEqual(body, b'')
+
+    def test_multiple_ranges_are_ignored(self):
+        response, body = self.get(Range='bytes=0-1,5-6')
+        self.assertEqual((response.status, body), (200, self.content))
+
+    def test_if_range(self):
+        etag = self.get()[0].getheader('ETag')
+        self.assertEqual(self.get(Range='bytes=0-9', If_Range=etag)[0].status, 206)
+        response, body = self.get(Range='bytes=0-9', If_Range='"old"')
+        self.assertEqual((response.status, body), (200, self.content))
+
+    def test_missing_and_null_byte_paths(self):
+        for path in ('/missing.css', '/a%00b', '/../main.py'):
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path)[0].status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import GroupCommitWriter, MessageLog, timestamp
+
+
+class TestGroupCommitWriter(unittest.TestCase):
+
+    def setUp(self):
+        """
+        A message log in a temporary folder, the snapshot is never there at the start.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self.folder = tempfile.TemporaryDirectory()
+        self.log = MessageLog(os.path.join(self.folder.name, 'data.jsonl'),
+                              os.path.join(self.folder.name, 'data.json'))
+
+    def tearDown(self):
+        self.log.close()
+        self.folder.cleanup()
+
+    def write(self, count: int, batch: int) -> list:
+        """
+        Submit count records to a writer committing batch records at most and wait for it.
+
+        :param count: records submitted
+        :param batch: records in one commit at most
+        :return: the messages read back from the log in order
+        """
+        writer = GroupCommitWriter(self.log, batch=batch, interval=0.05, metrics_interval=60)
+        # everything is queued before the writer starts, so every commit but the last one is full
+        for number in range(count):
+            self.assertTrue(writer.submit(timestamp(), {'message': str(number)}, perf_counter()))
+        writer.start()
+        writer.stop()
+        self.assertEqual(writer.written, count)
+        return [data['message'] for _, data in self.log.read()]
+
+    def test_full_batches_keep_every_record(self):
+        self.assertEqual(self.write(10, 4), [str(number) for number in range(10)])
+
+    def test_exact_multiple_of_batch(self):
+        self.assertEqual(self.write(8, 4), [str(number) for number in range(8)])
+
+    def test_batch_of_one(self):
+        self.assertEqual(self.write(5, 1), [str(number) for number in range(5)])
+
+    def test_records_after_start(self):
+        writer = GroupCommitWriter(self.log, batch=3, interval=0.001, metrics_interval=60)
+        writer.start()
+        for number in range(20):
+            writer.submit(timestamp(), {'message': str(number)}, perf_counter())
+        writer.stop()
+        self.assertEqual(len(self.log), 20)
+
+
+class TestMessageLog(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Paths of a log and its snapshot in a temporary folder, nothing is created yet.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'data.jsonl')
+        self.snapshot_path = os.path.join(self.folder.name, 'data.json')
+        self.records = {'2022-12-21 23:54:50.340686': {'username': 'Serhii', 'message': 'Hi'},
+                        '2022-12-22 10:00:00.000001': {'username': 'Олена', 'message': 'a=b&c\nd'},
+                        '2022-12-23 08:30:00.500000': {}}
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def open_log(self) -> MessageLog:
+        log = MessageLog(self.path, self.snapshot_path)
+        self.addCleanup(log.close)
+        return log
+
+    def test_snapshot_is_imported_on_first_open(self):
+        with open(self.snapshot_path, 'w', encoding='utf-8') as file:
+            json.dump(self.records, file, indent=4)
+        log = self.open_log()
+        self.assertEqual(dict(log.read()), self.records)
+        log.close()
+        # the second open reads the log only, the snapshot is not imported again
+        self.assertEqual(len(self.open_log()), len(self.records))
+
+    def test_torn_last_line_is_cut_off(self):
+        log = self.open_log()
+        log.append_batch(list(self.records.items()))
+        log.close()
+        size = os.path.getsize(self.path)
+        with open(self.path, 'ab') as file:
+            file.write(b'{"time": "2022-12-24 00:00:00.000000", "da')
+        log = self.open_log()
+        self.assertEqual(os.path.getsize(self.path), size)
+        self.assertEqual(dict(log.read()), self.records)
+        # the next record starts on a new line
+        log.append('2022-12-24 00:00:00.000000', {'message': 'after'})
+        self.assertEqual(list(log.read())[-1], ('2022-12-24 00:00:00.000000', {'message': 'after'}))
+
+    def test_broken_middle_line_is_skipped(self):
+        log = self.open_log()
+        log.append('2022-12-21 00:00:00.000000', {'message': 'first'})
+        log.close()
+        with open(self.path, 'ab') as file:
+            file.write(b'not json\n')
+        log = self.open_log()
+        log.append('2022-12-22 00:00:00.000000', {'message': 'last'})
+        self.assertEqual([data['message'] for _, data in log.read()], ['first', 'last'])
+
+    def test_read_between_times(self):
+        log = self.open_log()
+        times = [f'2022-12-21 10:00:{second:02d}.000000' for second in range(10)]
+        # the clock went back: the record is still read in the order of time
+        for time in times[:5] + times[6:] + times[5:6]:
+            log.append(time, {'time': time})
+        self.assertEqual([time for time, _ in log.read()], times)
+        self.assertEqual([time for time, _ in log.read(times[3], times[6])], times[3:7])
+        self.assertEqual([time for time, _ in log.read('2022-12-21 10:00:03.500000', '2022-12-21 10:00:05.500000')],
+                         times[4:6])
+        self.assertEqual([time for time, _ in log.read(since=times[8])], times[8:])
+        self.assertEqual([time for time, _ in log.read(until=times[1])], times[:2])
+        self.assertEqual(list(log.read('2023-01-01 00:00:00')), [])
+
+    def test_compact_matches_json_dump(self):
+        log = self.open_log()
+        log.append_batch(list(self.records.items()))
+        self.assertEqual(log.compact(), len(self.records))
+        with open(self.snapshot_path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), json.dumps(self.records, indent=4))
+
+    def test_compact_of_empty_log(self):
+        log = self.open_log()
+        self.assertEqual(log.compact(), 0)
+        with open(self.snapshot_path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), json.dumps({}, indent=4))
+
+
+if __name__ == '__main__':
+    unittest.main()
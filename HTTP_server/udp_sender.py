@@ -0,0 +1,119 @@
+from queue import Empty, Full, Queue
+import socket
+import threading
+from time import perf_counter
+
+# forms waiting for the batching thread, new ones are refused above it
+QUEUE_SIZE = 10_000
+# bytes of a batched datagram at most
+BATCH_BYTES = 8192
+# seconds a batch waits for more forms after the first one
+BATCH_INTERVAL = 0.002
+# forms are separated by a newline in a datagram, the newlines of a form are sent as %0A,
+# parse_qsl reads them back the same
+SEPARATOR = b'\n'
+ESCAPED_SEPARATOR = b'%0A'
+
+
+class UDPSender:
+    """ Forms sent to the socket server through connected UDP sockets kept open: one per thread,
+    so there is no lock and the number of sockets is bounded by the pool of the HTTP server.
+    A failed send is retried once with a new socket. With batch > 1 a thread collects the forms
+    and sends up to batch of them in one datagram, separated by newlines.
+    """
+
+    def __init__(self, address: tuple, batch: int = 1, interval: float = BATCH_INTERVAL,
+                 max_bytes: int = BATCH_BYTES, queue_size: int = QUEUE_SIZE):
+        self.address = address
+        self.batch = batch
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.errors = 0
+        self.queue = None
+        if batch > 1:
+            self.queue = Queue(queue_size)
+            threading.Thread(target=self.run, name='udp-batcher', daemon=True).start()
+
+    def socket(self) -> socket.socket:
+        sock = getattr(self.local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.connect(self.address)
+            except OSError:
+                sock.close()
+                raise
+            self.local.sock = sock
+        return sock
+
+    def send(self, data: bytes) -> bool:
+        """ Send a form, in batch mode it is only queued
+
+        :param data: urlencoded form
+        :return: False if it could not be sent or queued
+        """
+        # the socket server splits every datagram on the newlines, e.g. of a text/plain body
+        data = data.replace(SEPARATOR, ESCAPED_SEPARATOR)
+        if self.queue is None:
+            return self.send_datagram(data)
+        try:
+            self.queue.put_nowait(data)
+        except Full:
+            self.failed('the batch queue is full')
+            return False
+        return True
+
+    def send_datagram(self, data: bytes) -> bool:
+        error = None
+        for _ in range(2):
+            try:
+                self.socket().send(data)
+                return True
+            except OSError as err:
+                # e.g. ECONNREFUSED reported for an earlier datagram while the server was down
+                error = err
+                self.close()
+        self.failed(error)
+        return False
+
+    def failed(self, error):
+        with self.lock:
+            self.errors += 1
+        print(f'Form was not sent to the socket server: {error}')
+
+    def run(self):
+        carry = None
+        while True:
+            data = carry if carry is not None else self.queue.get()
+            carry = None
+            batch, size = [data], len(data)
+            deadline = perf_counter() + self.interval
+            while len(batch) < self.batch:
+                try:
+                    data = self.queue.get_nowait()
+                except Empty:
+                    remaining = deadline - perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        data = self.queue.get(timeout=remaining)
+                    except Empty:
+                        break
+                if size + len(SEPARATOR) + len(data) > self.max_bytes:
+                    carry = data
+                    break
+                batch.append(data)
+                size += len(SEPARATOR) + len(data)
+            self.send_datagram(SEPARATOR.join(batch))
+
+    def close(self):
+        """ Close the socket of the calling thread
+
+        :return: None
+        """
+        sock = getattr(self.local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self.local.sock = None
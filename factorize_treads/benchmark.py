@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+from factor_cache import FactorCache
+from factorize_treads import (factorize, factorize_batch, factorize_naive, factorize_parallel, factorize_trial,
+                              get_sieve, is_prime, np)
+
+
+def batch_dict(numbers) -> dict:
+    offsets, divisors = factorize_batch(numbers)
+    return {n: divisors[offsets[i]:offsets[i + 1]].tolist() for i, n in enumerate(numbers)}
+
+
+# strategy: (function of the list of numbers, biggest number it is run on)
+STRATEGIES = {
+    'naive': (lambda numbers: factorize_naive(*numbers), 10 ** 5),
+    'trial': (lambda numbers: factorize_trial(*numbers), 2 ** 40),
+    'batch': (batch_dict, 2 ** 40),
+    'sieve': (lambda numbers: factorize(*numbers), None),
+    'pool': (lambda numbers: factorize_parallel(numbers), None),
+    'pool-chunked': (lambda numbers: factorize_parallel(numbers, chunksize=64), None),
+}
+if np is None:
+    del STRATEGIES['batch']
+
+
+def random_prime(rnd: random.Random, bits: int) -> int:
+    while True:
+        n = rnd.getrandbits(bits) | 1 << bits - 1 | 1
+        if is_prime(n):
+            return n
+
+
+def distribution(name: str, count: int, seed: int = 0) -> list:
+    """ Fixed input sets: 'small' up to 10 ** 4, 'mixed' with uniform bit length up to 32,
+    'semiprimes' products of two 31 bit primes
+
+    :param name: name of the set
+    :param count: numbers
+    :param seed: random seed
+    :return: list of int
+    """
+    rnd = random.Random(f'{name}:{seed}')
+    if name == 'small':
+        return [rnd.randint(1, 10 ** 4) for _ in range(count)]
+    if name == 'mixed':
+        return [rnd.getrandbits(rnd.randint(1, 32)) or 1 for _ in range(count)]
+    if name == 'semiprimes':
+        return [random_prime(rnd, 31) * random_prime(rnd, 31) for _ in range(count)]
+    raise ValueError(f'unknown distribution {name}')
+
+
+DISTRIBUTIONS = {'small': 2000, 'mixed': 2000, 'semiprimes': 200}
+
+
+def bench_batch(counts, max_value: int, seed: int = 0):
+    """ factorize_batch against the pure python trial division on the same random numbers
+
+    :param counts: sizes of the batches
+    :param max_value: numbers are taken from 1..max_value
+    :param seed: random seed
+    :return: None
+    """
+    rnd = random.Random(seed)
+    for count in counts:
+        numbers = [rnd.randint(1, max_value) for _ in range(count)]
+        start = perf_counter()
+        offsets, divisors = factorize_batch(numbers)
+        batch_time = perf_counter() - start
+        start = perf_counter()
+        expected = factorize_trial(*numbers)
+        loop_time = perf_counter() - start
+        for i, n in enumerate(numbers):
+            if divisors[offsets[i]:offsets[i + 1]].tolist() != expected[n]:
+                raise AssertionError(f'different divisors for {n}')
+        print(f'{count} numbers up to {max_value}: numpy {batch_time:.3f} s, python loop {loop_time:.3f} s, '
+              f'speedup {loop_time / batch_time:.1f}x')
+
+
+def bench_cache(count: int, bits: int, workers: int, seed: int = 0):
+    """ factorize with an empty cache, the same numbers again from disk (new FactorCache)
+    and from memory, then the process pool sharing the cache file
+
+    :param count: numbers
+    :param bits: size of the numbers
+    :param workers: processes of the pool
+    :param seed: random seed
+    :return: None
+    """
+    rnd = random.Random(seed)
+    numbers = [rnd.getrandbits(bits) | 1 for _ in range(count)]
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'cache.sqlite')
+        start = perf_counter()
+        expected = factorize(*numbers)
+        print(f'no cache: {perf_counter() - start:.3f} s')
+        cache = FactorCache(path)
+        for title in ('cold cache', 'memory'):
+            start = perf_counter()
+            result = factorize(*numbers, cache=cache)
+            print(f'{title}: {perf_counter() - start:.3f} s')
+            if result != expected:
+                raise AssertionError(f'different result with the cache ({title})')
+        cache.close()
+        start = perf_counter()
+        result = factorize(*numbers, cache=FactorCache(path))
+        print(f'disk: {perf_counter() - start:.3f} s')
+        start = perf_counter()
+        parallel = factorize_parallel(numbers, workers, chunksize=64, cache=FactorCache(path))
+        print(f'{workers} processes from disk: {perf_counter() - start:.3f} s')
+        if result != expected or parallel != expected:
+            raise AssertionError('different result from the disk cache')
+
+
+def run_one(strategy: str, name: str, count: int, repeat: int, seed: int = 0) -> dict:
+    """ Run the strategy on the distribution in this process and measure it.
+    The sieve is built before the timing, it is built once per process anyway.
+
+    :param strategy: name from STRATEGIES
+    :param name: name of the distribution
+    :param count: numbers
+    :param repeat: timed runs
+    :param seed: random seed
+    :return: times, peak RSS of this process and of the pool processes, digest of the result
+    """
+    numbers = distribution(name, count, seed)
+    function = STRATEGIES[strategy][0]
+    get_sieve()
+    times, digest = [], None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = function(numbers)
+        times.append(perf_counter() - start)
+        digest = hashlib.sha256(json.dumps(list(result.items())).encode()).hexdigest()
+    # kilobytes on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {'times': times,
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            'peak_rss_children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+            'digest': digest}
+
+
+def bench_strategies(args) -> dict:
+    """ Every strategy on every distribution, each pair in a new process so the memory is its own.
+    A strategy is skipped on a distribution above its limit (naive and trial division are too slow there).
+    All the strategies run on a distribution must give the same result.
+
+    :param args: command line arguments
+    :return: results
+    """
+    results = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count(), 'repeat': args.repeat, 'seed': args.seed, 'counts': {}},
+               'distributions': {}}
+    try:
+        results['meta']['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                                   text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                                   check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        results['meta']['commit'] = None
+    for name in args.distributions:
+        count = args.count or DISTRIBUTIONS[name]
+        results['meta']['counts'][name] = count
+        biggest = max(distribution(name, count, args.seed))
+        measured = results['distributions'][name] = {}
+        for strategy in args.strategies:
+            limit = STRATEGIES[strategy][1]
+            if limit is not None and biggest > limit:
+                continue
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), 'run-one', strategy, name,
+                                     '--count', str(count), '--repeat', str(args.repeat), '--seed', str(args.seed)],
+                                    capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            run = json.loads(output.strip().splitlines()[-1])
+            times = sorted(run['times'])
+            run.update({'min': times[0], 'median': statistics.median(times),
+                        'p95': statistics.quantiles(times, n=20, method='inclusive')[18] if len(times) > 1 else times[0]})
+            measured[strategy] = run
+        if len({run['digest'] for run in measured.values()}) > 1:
+            raise AssertionError(f'strategies differ on {name}: '
+                                 + ', '.join(f'{strategy} {run["digest"][:12]}' for strategy, run in measured.items()))
+    return results
+
+
+def markdown_table(results: dict) -> str:
+    """ Results of bench_strategies as a markdown table
+
+    :param results: results
+    :return: table
+    """
+    lines = ['| distribution | strategy | min, s | median, s | p95, s | peak RSS, MiB | pool peak RSS, MiB |',
+             '|---|---|---:|---:|---:|---:|---:|']
+    for name, measured in results['distributions'].items():
+        for strategy, run in measured.items():
+            lines.append(f'| {name} | {strategy} | {run["min"]:.4f} | {run["median"]:.4f} | {run["p95"]:.4f} '
+                         f'| {run["peak_rss"] / 2 ** 20:.1f} | {run["peak_rss_children"] / 2 ** 20:.1f} |')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for factorize')
+    commands = parser.add_subparsers(dest='command', required=True)
+    batch = commands.add_parser('batch', help='numpy batch mode against the python loop')
+    batch.add_argument('--counts', type=int, nargs='+', default=[10 ** 5, 10 ** 6])
+    batch.add_argument('--max-value', type=int, default=10 ** 6)
+    batch.add_argument('--seed', type=int, default=0)
+    cache = commands.add_parser('cache', help='factorize with the persistent cache')
+    cache.add_argument('--count', type=int, default=10 ** 4)
+    cache.add_argument('--bits', type=int, default=48)
+    cache.add_argument('--workers', type=int, default=4)
+    cache.add_argument('--seed', type=int, default=0)
+    strategies = commands.add_parser('strategies', help='all factorize strategies on fixed input sets')
+    strategies.add_argument('--strategies', nargs='+', choices=list(STRATEGIES), default=list(STRATEGIES))
+    strategies.add_argument('--distributions', nargs='+', choices=list(DISTRIBUTIONS), default=list(DISTRIBUTIONS))
+    strategies.add_argument('--count', type=int, default=None, help='numbers in every set instead of the defaults')
+    strategies.add_argument('--repeat', type=int, default=5)
+    strategies.add_argument('--seed', type=int, default=0)
+    strategies.add_argument('--json', default='benchmark_results.json', help='write the results to this file')
+    one = commands.add_parser('run-one', help='one measured strategy, used by the strategies benchmark')
+    one.add_argument('strategy', choices=list(STRATEGIES))
+    one.add_argument('distribution', choices=list(DISTRIBUTIONS))
+    one.add_argument('--count', type=int, required=True)
+    one.add_argument('--repeat', type=int, default=5)
+    one.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'batch':
+        bench_batch(args.counts, args.max_value, args.seed)
+    elif args.command == 'cache':
+        bench_cache(args.count, args.bits, args.workers, args.seed)
+    elif args.command == 'strategies':
+        strategy_results = bench_strategies(args)
+        print(markdown_table(strategy_results))
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump(strategy_results, file, indent=4)
+    elif args.command == 'run-one':
+        print(json.dumps(run_one(args.strategy, args.distribution, args.count, args.repeat, args.seed)))
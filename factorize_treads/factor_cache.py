@@ -0,0 +1,106 @@
+from collections import OrderedDict
+import os
+import sqlite3
+from time import time_ns
+
+CACHE_PATH = 'factorize_cache.sqlite'
+# factorizations kept in memory by each process
+MEMORY_SIZE = 100_000
+# rows kept on disk, the oldest rows are deleted above it
+MAX_ROWS = 10_000_000
+# puts between two checks of the number of rows
+CAP_CHECK = 10_000
+
+
+def encode(factors: dict) -> str:
+    """ {2: 2, 3: 1} -> '2:2,3:1'
+
+    :param factors: prime factorization
+    :return: str
+    """
+    return ','.join(f'{p}:{k}' for p, k in factors.items())
+
+
+def decode(text: str) -> dict:
+    if not text:
+        return {}
+    return {int(p): int(k) for p, k in (item.split(':') for item in text.split(','))}
+
+
+class FactorCache:
+    """ Prime factorizations (not the divisor lists) stored in SQLite with an LRU dict in front.
+    Every process opens its own connection, WAL mode lets the processes of a pool read while one writes.
+    The memory part is LRU, on disk the oldest written rows are removed when there are more than max_rows.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, memory_size: int = MEMORY_SIZE, max_rows: int = MAX_ROWS):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self.memory = OrderedDict()
+        self.conn = None
+        self.pid = None
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # sent to the workers of a pool: only the settings, each process connects itself
+        return {'path': self.path, 'memory_size': self.memory_size, 'max_rows': self.max_rows}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def connection(self) -> sqlite3.Connection:
+        if self.conn is None or self.pid != os.getpid():
+            # a connection must not be used after fork, the child opens a new one
+            self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS factors '
+                              '(n TEXT PRIMARY KEY, factors TEXT NOT NULL, written INTEGER NOT NULL)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS factors_written ON factors (written)')
+            self.pid = os.getpid()
+        return self.conn
+
+    def get(self, n: int):
+        """ Prime factorization of n or None
+
+        :param n: number
+        :return: dict or None
+        """
+        factors = self.memory.get(n)
+        if factors is not None:
+            self.memory.move_to_end(n)
+            self.hits += 1
+            return factors
+        row = self.connection().execute('SELECT factors FROM factors WHERE n = ?', (str(n),)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        factors = decode(row[0])
+        self.remember(n, factors)
+        return factors
+
+    def remember(self, n: int, factors: dict):
+        self.memory[n] = factors
+        self.memory.move_to_end(n)
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def put(self, n: int, factors: dict):
+        self.remember(n, factors)
+        conn = self.connection()
+        conn.execute('INSERT OR REPLACE INTO factors VALUES (?, ?, ?)', (str(n), encode(factors), time_ns()))
+        self.puts += 1
+        if self.puts % CAP_CHECK == 0:
+            extra = conn.execute('SELECT COUNT(*) FROM factors').fetchone()[0] - self.max_rows
+            if extra > 0:
+                conn.execute('DELETE FROM factors WHERE n IN '
+                             '(SELECT n FROM factors ORDER BY written LIMIT ?)', (extra,))
+
+    def close(self):
+        if self.conn is not None and self.pid == os.getpid():
+            self.conn.close()
+        self.conn = None
@@ -1,8 +1,405 @@
-from time import time
-from multiprocessing import Pool, cpu_count
+import argparse
+from array import array
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import islice
+import json
+from math import gcd, isqrt
+import random
+import sys
+from time import perf_counter
+from multiprocessing import cpu_count, shared_memory
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def factorize(*number) -> dict:
+# numbers up to the limit are factorized by the table of smallest prime factors
+SIEVE_LIMIT = 1 << 20
+# tile of factorize_batch: numbers x candidate divisors, 1024 x 1024 int64 is 8 MiB
+BATCH_ROWS = 1024
+BATCH_COLS = 1024
+# lines sent to a process at once by factorize_stream
+STREAM_CHUNK = 1000
+# seconds between two progress reports of factorize_stream
+REPORT_INTERVAL = 5
+# Miller-Rabin with these bases is exact for n < 3.3 * 10 ** 24
+MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+# python 3.13+ can attach to a segment without the resource tracker, the creator alone unlinks it
+SHM_ATTACH = {'track': False} if sys.version_info >= (3, 13) else {}
+
+_spf = None
+_small_primes = ()
+# segment of the table attached by attach_sieve, kept open for the life of the process
+_sieve_memory = None
+
+
+def smallest_prime_factors(limit: int) -> array:
+    """ Table spf[n] = the smallest prime factor of n for 2 <= n <= limit
+
+    :param limit: last number of the table
+    :return: array('I')
+    """
+    spf = array('I', range(limit + 1))
+    marks = bytearray([1]) * (isqrt(limit) + 1)
+    primes = []
+    for i in range(2, len(marks)):
+        if marks[i]:
+            primes.append(i)
+            marks[i * i::i] = bytes(len(range(i * i, len(marks), i)))
+    # bigger primes first: a smaller prime written later wins
+    for p in reversed(primes):
+        spf[p * p::p] = array('I', [p]) * len(range(p * p, limit + 1, p))
+    return spf
+
+
+def get_sieve():
+    """ The table is built once, on the first call, or taken from shared memory by attach_sieve()
+
+    :return: array('I') or memoryview of format 'I'
+    """
+    if _spf is None:
+        _set_sieve(smallest_prime_factors(SIEVE_LIMIT))
+    return _spf
+
+
+def _set_sieve(spf):
+    global _spf, _small_primes
+    _spf = spf
+    _small_primes = tuple(p for p in range(2, 1000) if spf[p] == p)
+
+
+@contextmanager
+def shared_sieve():
+    """ The table of get_sieve() copied once into shared memory for a pool of processes.
+    The segment is removed on exit, after the pool is closed.
+
+    :return: name of the segment for attach_sieve()
+    """
+    spf = memoryview(get_sieve()).cast('B')
+    memory = shared_memory.SharedMemory(create=True, size=len(spf))
+    try:
+        memory.buf[:len(spf)] = spf
+        yield memory.name
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def attach_sieve(name: str):
+    """ Use the table published by shared_sieve() in place of get_sieve(), without a copy:
+    every process maps the same pages. The mapping is dropped when the process exits.
+
+    :param name: name of the segment
+    :return: None
+    """
+    global _sieve_memory
+    _sieve_memory = shared_memory.SharedMemory(name=name, **SHM_ATTACH)
+    size = (SIEVE_LIMIT + 1) * array('I').itemsize
+    _set_sieve(_sieve_memory.buf[:size].cast('I'))
+
+
+def is_prime(n: int) -> bool:
+    if n < 2:
+        return False
+    for p in MR_BASES:
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while not d & 1:
+        d >>= 1
+        s += 1
+    for a in MR_BASES:
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def pollard_rho(n: int) -> int:
+    """ A non-trivial factor of the composite odd number n (Brent's variant)
+
+    :param n: composite number
+    :return: factor
+    """
+    rnd = random.Random(n)
+    while True:
+        y, c, m = rnd.randrange(1, n), rnd.randrange(1, n), 128
+        g = r = q = 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd(q, n)
+                k += m
+            r *= 2
+        if g == n:
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd(abs(x - ys), n)
+        if g != n:
+            return g
+
+
+def prime_factors(n: int) -> dict:
+    """ Prime factorization {prime: power}: the sieve for small numbers,
+    trial division by small primes and Pollard-rho for big ones
+
+    :param n: number > 0
+    :return: dict
+    """
+    spf = get_sieve()
+    factors = {}
+    if n > SIEVE_LIMIT:
+        for p in _small_primes:
+            while n % p == 0:
+                factors[p] = factors.get(p, 0) + 1
+                n //= p
+        stack = [n] if n > 1 else []
+        while stack:
+            m = stack.pop()
+            if m <= SIEVE_LIMIT:
+                for p, k in prime_factors(m).items():
+                    factors[p] = factors.get(p, 0) + k
+            elif is_prime(m):
+                factors[m] = factors.get(m, 0) + 1
+            else:
+                d = pollard_rho(m)
+                stack += [d, m // d]
+        return dict(sorted(factors.items()))
+    while n > 1:
+        p = spf[n]
+        factors[p] = factors.get(p, 0) + 1
+        n //= p
+    return factors
+
+
+def divisors(factors: dict) -> list:
+    """ All divisors from the prime factorization, in ascending order
+
+    :param factors: {prime: power}
+    :return: list
+    """
+    result = [1]
+    for p, k in factors.items():
+        result = [d * p ** e for d in result for e in range(k + 1)]
+    return sorted(result)
+
+
+def cached_prime_factors(n: int, cache=None) -> dict:
+    """ prime_factors() through a cache with get(n) and put(n, factors), e.g. factor_cache.FactorCache
+
+    :param n: number > 0
+    :param cache: cache or None
+    :return: dict
+    """
+    if cache is None:
+        return prime_factors(n)
+    factors = cache.get(n)
+    if factors is None:
+        factors = prime_factors(n)
+        cache.put(n, factors)
+    return factors
+
+
+def factorize(*number, cache=None) -> dict:
+    out_dict = {}
+    for i in number:
+        out_dict[i] = divisors(cached_prime_factors(i, cache)) if i > 0 else []
+    return out_dict
+
+
+_worker_cache = None
+
+
+def _init_worker(cache, sieve_name: str = None):
+    global _worker_cache
+    _worker_cache = cache
+    if sieve_name is not None:
+        attach_sieve(sieve_name)
+
+
+def _factorize_one(n: int) -> tuple:
+    return n, divisors(cached_prime_factors(n, _worker_cache)) if n > 0 else []
+
+
+def factorize_parallel(numbers, workers: int = None, chunksize: int = 1, cache=None) -> dict:
+    """ factorize() over a pool of processes: the numbers are sent biggest first,
+    so the longest jobs start at once and the small ones fill the gaps at the end
+
+    :param numbers: iterable of int
+    :param workers: number of processes, cpu_count() by default
+    :param chunksize: numbers sent to a process at once, 1 keeps the best balance
+    :param cache: cache shared by the processes, it must be picklable (FactorCache is)
+    :return: dict in the order of numbers
+    """
+    numbers = list(numbers)
+    out_dict = dict.fromkeys(numbers)
+    with shared_sieve() as sieve_name, ProcessPoolExecutor(max_workers=workers or cpu_count(),
+                                                           initializer=_init_worker,
+                                                           initargs=(cache, sieve_name)) as executor:
+        for n, division_list in executor.map(_factorize_one, sorted(set(numbers), reverse=True),
+                                             chunksize=chunksize):
+            out_dict[n] = division_list
+    return out_dict
+
+
+def _factorize_lines(lines: list) -> tuple:
+    """ Parse a chunk of input lines and factorize the numbers in the worker,
+    so the main process only moves text
+
+    :param lines: lines with integers separated by whitespace
+    :return: (count of numbers, json lines)
+    """
+    out, count = [], 0
+    for line in lines:
+        for token in line.split():
+            count += 1
+            try:
+                n = int(token)
+            except ValueError:
+                out.append(json.dumps({'input': token, 'error': 'not an integer'}))
+                continue
+            division_list = divisors(cached_prime_factors(n, _worker_cache)) if n > 0 else []
+            out.append(json.dumps({'n': n, 'divisors': division_list}))
+    out.append('')
+    return count, '\n'.join(out)
+
+
+def factorize_stream(source, output, workers: int = None, chunk: int = STREAM_CHUNK, ordered: bool = True,
+                     cache=None, report=sys.stderr) -> int:
+    """ Factorize a stream of integers over a pool of processes and write one json line per number.
+    Chunks of lines are read only when a process is free, at most 2 * workers chunks are in flight,
+    so memory does not depend on the length of the input. In ordered mode the results wait in
+    submission order (the reorder buffer is the queue of pending chunks), unordered writes every chunk
+    as soon as it is ready.
+
+    :param source: iterable of lines, e.g. a file or sys.stdin
+    :param output: file with write()
+    :param workers: number of processes, cpu_count() by default
+    :param chunk: lines in a chunk
+    :param ordered: keep the input order
+    :param cache: cache shared by the processes, see factorize_parallel
+    :param report: file for the numbers/s reports or None
+    :return: count of numbers
+    """
+    workers = workers or cpu_count()
+    window = 2 * workers
+    lines = iter(source)
+    done = 0
+    start = last_report = perf_counter()
+
+    def write(result):
+        nonlocal done, last_report
+        count, text = result
+        output.write(text)
+        done += count
+        now = perf_counter()
+        if report is not None and now - last_report >= REPORT_INTERVAL:
+            print(f'{done} numbers, {done / (now - start):.0f} numbers/s', file=report)
+            last_report = now
+
+    with shared_sieve() as sieve_name, ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                           initargs=(cache, sieve_name)) as executor:
+        pending = deque() if ordered else set()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < window:
+                lines_chunk = list(islice(lines, chunk))
+                if not lines_chunk:
+                    exhausted = True
+                    break
+                future = executor.submit(_factorize_lines, lines_chunk)
+                pending.append(future) if ordered else pending.add(future)
+            if not pending:
+                break
+            if ordered:
+                write(pending.popleft().result())
+            else:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    write(future.result())
+    if report is not None:
+        elapsed = perf_counter() - start
+        print(f'{done} numbers in {elapsed:.3f} s, {done / elapsed if elapsed else 0:.0f} numbers/s', file=report)
+    return done
+
+
+def factorize_trial(*number) -> dict:
+    """ Trial division up to the square root, each divisor d gives the pair d and i // d
+
+    :param number: numbers
+    :return: dict
+    """
+    out_dict = {}
+    for i in number:
+        small, big = [], []
+        for d in range(1, isqrt(i) + 1 if i > 0 else 1):
+            if i % d == 0:
+                small.append(d)
+                if d * d != i:
+                    big.append(i // d)
+        out_dict[i] = small + big[::-1]
+    return out_dict
+
+
+def factorize_batch(numbers, rows: int = BATCH_ROWS, cols: int = BATCH_COLS) -> tuple:
+    """ Divisors of many numbers at once with numpy: vectorized trial division by 1..isqrt(max),
+    the numbers and the candidates are broadcast in tiles of rows x cols, so memory does not depend
+    on the batch size. The result is CSR-like: the divisors of numbers[i] are
+    divisors[offsets[i]:offsets[i + 1]] in ascending order, numbers < 1 have none.
+
+    :param numbers: sequence or array of int, each < 2 ** 63
+    :param rows: numbers in a tile
+    :param cols: candidate divisors in a tile
+    :return: (offsets, divisors) int64 arrays
+    """
+    if np is None:
+        raise ImportError('factorize_batch needs numpy')
+    values = np.asarray(numbers, dtype=np.int64).ravel()
+    # int32 division is faster, it is used when all numbers fit
+    dtype = np.int32 if len(values) and 0 <= values.max() < 2 ** 31 and values.min() >= -2 ** 31 else np.int64
+    found_rows, found_divisors = [np.empty(0, np.int64)], [np.empty(0, np.int64)]
+    for start in range(0, len(values), rows):
+        block = values[start:start + rows].astype(dtype)
+        root = isqrt(int(block.max())) if int(block.max()) > 0 else 0
+        for first in range(1, root + 1, cols):
+            candidates = np.arange(first, min(first + cols, root + 1), dtype=dtype)
+            hit = (block[:, None] % candidates == 0) & (candidates * candidates <= block[:, None])
+            row, col = np.nonzero(hit)
+            small = candidates[col].astype(np.int64)
+            found_rows += [row + start, row + start]
+            found_divisors += [small, block[row].astype(np.int64) // small]
+    found_rows = np.concatenate(found_rows)
+    found_divisors = np.concatenate(found_divisors)
+    order = np.lexsort((found_divisors, found_rows))
+    found_rows, found_divisors = found_rows[order], found_divisors[order]
+    # d * d == n gives the same divisor twice
+    keep = np.ones(len(found_rows), dtype=bool)
+    keep[1:] = (found_rows[1:] != found_rows[:-1]) | (found_divisors[1:] != found_divisors[:-1])
+    found_rows, found_divisors = found_rows[keep], found_divisors[keep]
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(found_rows, minlength=len(values)), out=offsets[1:])
+    return offsets, found_divisors
+
+
+def factorize_naive(*number) -> dict:
     out_dict = {}
     for i in number:
         division_list = []
@@ -16,13 +413,42 @@ def factorize(*number) -> dict:
 
 
 if __name__ == '__main__':
-    processors = cpu_count()
-    t1 = time()
-    result = factorize(321, 1345, 9999, 106514460)
-    print(f'час виконання лінійно: {time() - t1}')
-    print(type(result), result)
-    t2 = time()
-    pool = Pool(processors)
-    result = pool.apply_async(factorize, (321, 1345, 9999, 106514460))
-    print(f'час виконання на {processors} процесорах {time() - t2}')
-    print(type(result), result.get())
+    parser = argparse.ArgumentParser(description='Divisors of integers read from a file or stdin, '
+                                                 'one json line per number')
+    parser.add_argument('input', nargs='?', help='file with integers, stdin by default')
+    parser.add_argument('-o', '--output', help='file for the json lines, stdout by default')
+    parser.add_argument('--workers', type=int, default=cpu_count())
+    parser.add_argument('--chunk', type=int, default=STREAM_CHUNK, help='lines sent to a process at once')
+    parser.add_argument('--unordered', action='store_true', help='write results as soon as they are ready')
+    parser.add_argument('--cache', help='sqlite file of the persistent factorization cache')
+    parser.add_argument('--quiet', action='store_true', help='no numbers/s reports')
+    parser.add_argument('--demo', action='store_true', help='time factorize on the four sample numbers')
+    args = parser.parse_args()
+
+    if args.demo:
+        numbers = (321, 1345, 9999, 106514460)
+        processors = args.workers
+        t1 = perf_counter()
+        result = factorize(*numbers)
+        print(f'час виконання лінійно: {perf_counter() - t1}')
+        print(type(result), result)
+        # the time includes the start of the processes and the return of the results
+        t2 = perf_counter()
+        result = factorize_parallel(numbers, processors)
+        print(f'час виконання на {processors} процесорах {perf_counter() - t2}')
+        print(type(result), result)
+    else:
+        cache = None
+        if args.cache:
+            from factor_cache import FactorCache
+            cache = FactorCache(args.cache)
+        source = open(args.input) if args.input else sys.stdin
+        output = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            factorize_stream(source, output, args.workers, args.chunk, not args.unordered, cache,
+                             None if args.quiet else sys.stderr)
+        finally:
+            if args.input:
+                source.close()
+            if args.output:
+                output.close()
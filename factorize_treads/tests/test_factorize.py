@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+from math import prod
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from factorize_treads import (SIEVE_LIMIT, divisors, factorize, factorize_batch, factorize_naive, factorize_trial,
+                              get_sieve, is_prime, np, prime_factors)
+
+# 0 and negative numbers have no divisors
+NUMBERS = range(-20, 1500)
+SAMPLES = (321, 1345, 9999, 106514460)
+# numbers above SIEVE_LIMIT: 62-bit semiprimes, squares of primes, 2 ** 64 + 1 = 274177 * 67280421310721
+BIG = {2147483647 * 2147483629: {2147483629: 1, 2147483647: 1},
+       2147483587 * 2147483647: {2147483587: 1, 2147483647: 1},
+       1000000007 * 998244353: {998244353: 1, 1000000007: 1},
+       2147483647 ** 2: {2147483647: 2},
+       1000000007 ** 2 * 12: {2: 2, 3: 1, 1000000007: 2},
+       2 ** 64 + 1: {274177: 1, 67280421310721: 1},
+       2 ** 61 - 1: {2 ** 61 - 1: 1}}
+
+
+class TestFactorize(unittest.TestCase):
+
+    def test_factorize_matches_naive(self):
+        self.assertEqual(factorize(*NUMBERS), factorize_naive(*NUMBERS))
+
+    def test_trial_matches_naive(self):
+        self.assertEqual(factorize_trial(*NUMBERS), factorize_naive(*NUMBERS))
+
+    def test_samples(self):
+        expected = factorize_trial(*SAMPLES)
+        self.assertEqual(factorize(*SAMPLES), expected)
+        self.assertEqual(expected[106514460][-1], 106514460)
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_batch_matches_naive(self):
+        numbers = list(NUMBERS) + list(SAMPLES)
+        offsets, found = factorize_batch(numbers, rows=64, cols=100)
+        self.assertEqual(len(offsets), len(numbers) + 1)
+        expected = factorize_trial(*numbers)
+        for i, n in enumerate(numbers):
+            self.assertEqual(found[offsets[i]:offsets[i + 1]].tolist(), expected[n], n)
+
+    def test_is_prime_matches_sieve(self):
+        spf = get_sieve()
+        for n in range(100_000):
+            self.assertEqual(is_prime(n), n > 1 and spf[n] == n, n)
+
+    def test_is_prime_strong_pseudoprimes(self):
+        # composites that pass Miller-Rabin for the first 4, 7 and 9 prime bases
+        for n in (3215031751, 341550071728321, 3825123056546413051):
+            self.assertFalse(is_prime(n), n)
+            self.assertEqual(prod(p ** k for p, k in prime_factors(n).items()), n)
+
+    def test_prime_factors_above_sieve(self):
+        for n, expected in BIG.items():
+            self.assertGreater(n, SIEVE_LIMIT)
+            factors = prime_factors(n)
+            self.assertEqual(factors, expected, n)
+            self.assertEqual(prod(p ** k for p, k in factors.items()), n)
+            self.assertTrue(all(is_prime(p) for p in factors))
+
+    def test_divisors_of_big_number(self):
+        n = 2147483647 * 2147483629
+        self.assertEqual(divisors(prime_factors(n)), [1, 2147483629, 2147483647, n])
+
+
+if __name__ == '__main__':
+    unittest.main()